@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Micro-benchmark of `pyepm.api.abi_data` against the uncached encoding path
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/abi_data.py [iterations]`
+"""
+
+import sys
+import timeit
+
+from ethereum import abi
+from serpent import get_prefix
+
+from pyepm.api import abi_data
+from pyepm.utils import unhex
+
+def uncached_abi_data(sig, data):
+    data_abi = hex(get_prefix(sig)).rstrip('L')
+    types = sig.split(':')[1][1:-1].split(',')
+    for i, s in enumerate(data):
+        if isinstance(data[i], (str, unicode)) and data[i][:2] == "0x":
+            data[i] = unhex(data[i])
+    return data_abi + abi.encode_abi(types, data).encode('hex')
+
+CASES = [
+    ('multiply:[int256]:int256', [3]),
+    ('register:[int256,int256]:int256', ['0x72ba7d8e73fe8eb666ea66babc8116a41bfb10e2', 'SubcurrencyName']),
+    ('transfer:[address,uint256,int256,int256]:int256', ['0x72ba7d8e73fe8eb666ea66babc8116a41bfb10e2', 10 ** 18, -1, 42]),
+    ('set_stats:[int256[]]:int256', [range(16)]),
+]
+
+def main(iterations=20000):
+    for sig, data in CASES:
+        assert abi_data(sig, list(data)) == uncached_abi_data(sig, list(data))
+        before = timeit.timeit(lambda: uncached_abi_data(sig, list(data)), number=iterations)
+        after = timeit.timeit(lambda: abi_data(sig, list(data)), number=iterations)
+        print("%-50s uncached %6.2fus  cached %6.2fus  %5.1fx" % (
+            sig, before * 1e6 / iterations, after * 1e6 / iterations, before / after))
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
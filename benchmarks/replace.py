@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark of `$variable` substitution on a synthetic package
+
+Compares the placeholder index used by `Deploy.replace` against walking
+every definition for each variable, substituting every `set` variable and
+contract of a package with `steps` transactions.
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/replace.py [steps]`
+"""
+
+import copy
+import logging
+import sys
+import time
+
+from pyepm.placeholders import Placeholders
+
+def walk_replace(variable, definitions, replacement):
+    count = 0
+    for repdef in definitions:
+        for repkey in repdef:
+            for repname in repdef[repkey]:
+                if repkey != 'set':
+                    for repoption in repdef[repkey][repname]:
+                        to_replace = repdef[repkey][repname][repoption]
+                        if to_replace == "$%s" % variable:
+                            repdef[repkey][repname][repoption] = replacement
+                            count = count + 1
+                        if repoption == 'data':
+                            for i, repdata in enumerate(to_replace):
+                                if repdata == "$%s" % variable:
+                                    repdef[repkey][repname][repoption][i] = replacement
+                                    count = count + 1
+    return count
+
+def package(steps, contracts=100):
+    definitions = [{'set': dict(('Var%d' % i, i) for i in range(contracts))}]
+    for i in range(contracts):
+        definitions.append({'deploy': {'Contract%d' % i: {'contract': 'contract%d.se' % i}}})
+    for i in range(steps):
+        definitions.append({'transact': {'Transact%d' % i: {
+            'to': '$Contract%d' % (i % contracts),
+            'sig': 'set:[int256,int256]:int256',
+            'data': ['$Var%d' % (i % contracts), '$Contract%d' % ((i + 1) % contracts)]}}})
+    return definitions
+
+def substitutions(definitions):
+    for variable, value in sorted(definitions[0]['set'].items()):
+        yield variable, value
+    for definition in definitions[1:]:
+        for name in definition.get('deploy', {}):
+            yield name, '0x%040x' % hash(name)
+
+def main(steps=10000):
+    logging.disable(logging.DEBUG)
+    definitions = package(steps)
+
+    walked = copy.deepcopy(definitions)
+    start = time.time()
+    walked_counts = [walk_replace(variable, walked, value) for variable, value in substitutions(walked)]
+    before = time.time() - start
+
+    indexed = copy.deepcopy(definitions)
+    start = time.time()
+    index = Placeholders(indexed)
+    indexed_counts = [index.replace(variable, value) for variable, value in substitutions(indexed)]
+    after = time.time() - start
+
+    assert indexed == walked
+    assert indexed_counts == walked_counts
+    print("%d steps, %d substitutions: walk %.3fs  indexed %.3fs  %.1fx" % (
+        steps, len(walked_counts), before, after, before / after))
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -7,37 +7,63 @@
 
 import json
 import logging
-import requests
+import os
 import sys
+import threading
 import time
+from collections import OrderedDict
+from cache import CallCache, ChainCache, GasPriceCache
 from colors import colors
+from nonces import NonceManager
+from signer import LocalSigner
+from transport import EndpointPool, HttpTransport, is_read
 from uuid import uuid4
 
-from ethereum import abi
-from serpent import get_prefix, decode_datalist
-from utils import unhex
+from codec import compile_signature
+from ethereum.processblock import mk_contract_address
+from serpent import decode_datalist
+from utils import config_dir, unhex
 
 logger = logging.getLogger(__name__)
 logging.getLogger("requests").setLevel(logging.WARNING)
 
 def abi_data(sig, data):
-    prefix = get_prefix(sig)
-    data_abi = hex(prefix).rstrip('L')
-    logger.debug("ABI prefix: %s" % data_abi)
-
-    types = sig.split(':')[1][1:-1].split(',')
-    logger.debug("ABI types: %s" % types)
-
-    for i, s in enumerate(data):
-        if isinstance(data[i], (str, unicode)) and data[i][:2] == "0x":
-            data[i] = unhex(data[i])
-    logger.debug("ABI data: %s" % data)
-
-    data_abi += abi.encode_abi(types, data).encode('hex')
-    logger.debug("ABI encoded: %s" % data_abi)
+    data_abi = compile_signature(sig).encode(data)
+    logger.debug("ABI encoded: %s", data_abi)
 
     return data_abi
 
+def contract_address(sender, nonce):
+    if sender.startswith('0x'):
+        sender = sender[2:]
+    return '0x' + mk_contract_address(sender.decode('hex'), nonce).encode('hex')
+
+def _balance(result):
+    if result is not None:
+        return unhex(result)
+    return 0
+
+def _count(result):
+    if result is not None:
+        return unhex(result)
+    return None
+
+def _has_code(result):
+    if result is not None:
+        return unhex(result) != 0
+    return False
+
+def _block_number(block):
+    if isinstance(block, dict) and block.get('number') is not None:
+        number = block['number']
+        return unhex(number) if isinstance(number, basestring) else number
+    return None
+
+def _mined_block_number(transaction):
+    if isinstance(transaction, dict) and transaction.get('blockNumber') is not None:
+        return unhex(transaction['blockNumber'])
+    return None
+
 class ApiException(Exception):
     def __init__(self, code, message):
         self.code = code
@@ -47,14 +73,204 @@ class ApiException(Exception):
         return "code=%d, message=\"%s\"" % (self.code, self.message)
 
 
-class Api(object):
+# Queues RPC calls and sends them as JSON RPC 2.0 batches, keeping results in order
+class Batch(object):
+    def __init__(self, api, max_size=None):
+        self.api = api
+        self.max_size = max_size or api.batch_size
+        self.calls = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.execute()
+
+    def __len__(self):
+        return len(self.calls)
+
+    def rpc(self, method, params, formatter=None):
+        self.calls.append((method, params, formatter))
+        return len(self.calls) - 1
+
+    def balance_at(self, address, defaultBlock='latest'):
+        return self.rpc('eth_getBalance', [address, defaultBlock], _balance)
+
+    def transaction_count(self, address=None, defaultBlock='latest'):
+        if address is None:
+            address = self.api.address
+        return self.rpc('eth_getTransactionCount', [str(address), defaultBlock], _count)
+
+    def storage_at(self, address, index, defaultBlock='latest'):
+        return self.rpc('eth_getStorageAt', [address, hex(index), defaultBlock])
+
+    def is_contract_at(self, address, defaultBlock='latest'):
+        return self.rpc('eth_getCode', [address, defaultBlock], _has_code)
 
-    def __init__(self, config):
+    def transaction(self, transactionHash):
+        return self.rpc('eth_getTransactionByHash', [transactionHash])
+
+    def receipt(self, transactionHash):
+        return self.rpc('eth_getTransactionReceipt', [transactionHash])
+
+    # With a local signer, the transactions are signed together and sent raw
+    def send_transactions(self, transactions):
+        if self.api.signer is not None:
+            return [self.rpc('eth_sendRawTransaction', [raw]) for raw in self.api.signer.sign_all(transactions)]
+        return [self.rpc('eth_sendTransaction', [params]) for params in transactions]
+
+    def execute(self):
+        results = []
+        requests = 0
+        for start in range(0, len(self.calls), self.max_size):
+            chunk = self.calls[start:start + self.max_size]
+            responses = self.api._rpc_batch([(method, params) for method, params, _ in chunk])
+            requests += 1
+            for (_, _, formatter), result in zip(chunk, responses):
+                if formatter is not None and not isinstance(result, ApiException):
+                    result = formatter(result)
+                results.append(result)
+        logger.debug("Batch of %d calls in %d requests" % (len(self.calls), requests))
+        self.calls = []
+        self.results = results
+        return results
+
+
+# One block filter per node, counting the blocks seen for all its waiters
+class BlockFilter(object):
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, api, interval=0.25):
+        self.api = api
+        self.interval = interval
+        self.filter_id = None
+        self.supported = True
+        self.blocks = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, api, interval=0.25):
+        with cls._shared_lock:
+            if api.jsonrpc_url not in cls._shared:
+                cls._shared[api.jsonrpc_url] = cls(api, interval)
+            return cls._shared[api.jsonrpc_url]
+
+    def install(self):
+        self.filter_id = self.api._rpc_post('eth_newBlockFilter', None)
+        logger.debug("Installed block filter %s" % self.filter_id)
+
+    def uninstall(self):
+        if self.filter_id is not None:
+            self.api._rpc_post('eth_uninstallFilter', [self.filter_id])
+            self.filter_id = None
+
+    def changes(self):
+        if self.filter_id is None:
+            self.install()
+        try:
+            return self.api._rpc_post('eth_getFilterChanges', [self.filter_id]) or []
+        except ApiException as e:
+            # Nodes drop filters that aren't polled for a while, install a new one
+            logger.debug("Block filter %s failed, reinstalling: %s" % (self.filter_id, e))
+            self.install()
+            return self.api._rpc_post('eth_getFilterChanges', [self.filter_id]) or []
+
+    # Returns the number of blocks seen, more than `seen` if a block arrived within `timeout`
+    def wait(self, timeout, seen):
+        deadline = time.time() + timeout
+        while True:
+            with self._lock:
+                self.blocks += len(self.changes())
+                if self.blocks > seen:
+                    return self.blocks
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return seen
+            time.sleep(min(self.interval, remaining))
+
+
+# Yields (tx_hash, receipt) as transactions complete, None once skipped, False once retried
+class TransactionWaiter(object):
+    def __init__(self, api, retry=None, skip=None):
+        self.api = api
+        self.retry = retry
+        self.skip = skip
+        self.pending = OrderedDict()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, tx_hash, retry=None, skip=None):
+        if retry is None:
+            retry = self.retry
+        if skip is None:
+            skip = self.skip
+        if retry == 1:
+            retry = self.api.retry
+        if skip == 1:
+            skip = self.api.skip
+        self.pending[tx_hash] = (time.time(), retry, skip)
+
+    def remove(self, tx_hash):
+        self.pending.pop(tx_hash, None)
+
+    # Checks every pending transaction with one batch, returns the completed ones
+    def check(self):
+        if not self.pending:
+            return []
+        batch = self.api.batch()
+        for tx_hash in self.pending:
+            batch.receipt(tx_hash)
+        now = time.time()
+        completed = []
+        for (tx_hash, (start_time, retry, skip)), receipt in zip(self.pending.items(), batch.execute()):
+            if isinstance(receipt, ApiException):
+                logger.debug("Receipt for %s failed: %s" % (tx_hash, receipt))
+                receipt = None
+            if receipt is not None:
+                completed.append((tx_hash, receipt))
+            elif skip and now - start_time > skip:
+                logger.info("%s took too long, " % tx_hash + colors.FAIL + "skipping" + colors.ENDC + "...")
+                completed.append((tx_hash, None))
+            elif retry and now - start_time > retry:
+                logger.info("%s took too long, " % tx_hash + colors.WARNING + "retrying" + colors.ENDC + "...")
+                completed.append((tx_hash, False))
+        for tx_hash, _ in completed:
+            del self.pending[tx_hash]
+        return completed
+
+    def wait(self):
+        while self.pending:
+            if not self.api._wait_tick():
+                # No new block, only deadlines can have passed
+                now = time.time()
+                if not any((skip and now - start_time > skip) or (retry and now - start_time > retry)
+                           for start_time, retry, skip in self.pending.values()):
+                    continue
+            for completed in self.check():
+                yield completed
+
+
+class Api(object):
+    def __init__(self, config, transport=None):
         self.host = config.get('api', 'host')
         self.port = config.getint('api', 'port')
         self.jsonrpc_url = "http://%s:%s" % (self.host, self.port)
         logger.debug("Deploying to %s" % self.jsonrpc_url)
 
+        if transport is None:
+            transport = HttpTransport.shared(self.jsonrpc_url, config)
+        self.transport = transport
+
+        # Read-only calls can go to other nodes, everything else to host:port
+        self.readers = None
+        endpoints = [url.strip() for url in config.get('api', 'endpoints').split(',') if url.strip()]
+        if endpoints:
+            self.readers = EndpointPool.shared(endpoints, config, self.transport)
+
         address = config.get("api", "address")
         if not address.startswith('0x'):
             address = '0x' + address
@@ -64,24 +280,56 @@ class Api(object):
         self.gas_price = config.getint("deploy", "gas_price")
         self.fixed_price = config.getboolean("deploy", "fixed_price")
         self.gas_price_modifier = config.getfloat("deploy", "gas_price_modifier")
+        self.gas_prices = GasPriceCache.shared(self.jsonrpc_url, config.getfloat("deploy", "gas_price_ttl"))
 
         self.retry = config.getint("deploy", "retry")
         self.skip = config.getint("deploy", "skip")
-
-    def _rpc_post(self, method, params):
+        self.local_nonces = config.getboolean("deploy", "local_nonces")
+        self.signer = None
+        if config.getboolean("deploy", "local_signing"):
+            self.signer = LocalSigner.shared(config)
+        self.gas_bump = config.getfloat("deploy", "gas_bump")
+        self.gas_price_cap = config.getint("deploy", "gas_price_cap")
+
+        self.batch_size = config.getint("api", "batch_size")
+
+        self.call_cache = None
+        if config.getint("api", "call_cache"):
+            self.call_cache = CallCache.shared(self.jsonrpc_url,
+                                               config.getint("api", "call_cache"),
+                                               config.getfloat("api", "call_cache_interval"))
+
+        self.chain_cache = None
+        if config.getint("misc", "chain_cache_size"):
+            self.chain_cache = ChainCache.shared(os.path.join(config_dir.path, 'chain.db'),
+                                                 config.getint("misc", "chain_cache_size") * 1024 * 1024,
+                                                 config.getint("misc", "chain_cache_confirmations"))
+
+        self.wait_mode = config.get("api", "wait")
+        self.filter_interval = config.getfloat("api", "filter_interval")
+        self._block_filter = None
+        self._seen_blocks = 0
+
+    def _payload(self, method, params):
         if params is None:
             params = []
 
-        payload = {
+        return {
             "jsonrpc": "2.0",
             "id": str(uuid4()),
             "method": method,
             "params": params}
-        headers = {'content-type': 'application/json'}
 
-        logger.debug(json.dumps(payload))
+    def _post(self, payload):
+        data = json.dumps(payload)
+
+        logger.debug(data)
 
-        r = requests.post(self.jsonrpc_url, data=json.dumps(payload), headers=headers)
+        r = None
+        if self.readers is not None and is_read(payload):
+            r = self.readers.post(data)
+        if r is None:
+            r = self.transport.post(data)
         if r.status_code >= 400:
             raise ApiException(r.status_code, r.reason)
 
@@ -89,24 +337,62 @@ class Api(object):
 
         logger.debug(response)
 
+        return response
+
+    def _rpc_post(self, method, params):
+        response = self._post(self._payload(method, params))
+
         if 'error' in response:
             raise ApiException(response['error']['code'], response['error']['message'])
 
         return response.get('result')
 
+    # Results in request order, with an ApiException for each request that failed
+    def _rpc_batch(self, requests):
+        payloads = [self._payload(method, params) for method, params in requests]
+        response = self._post(payloads)
+
+        if isinstance(response, dict):
+            if 'error' in response:
+                raise ApiException(response['error']['code'], response['error']['message'])
+            raise ApiException(-32600, "Invalid batch response")
+
+        responses = dict((item.get('id'), item) for item in response)
+        results = []
+        for payload in payloads:
+            item = responses.get(payload['id'])
+            if item is None:
+                results.append(ApiException(-32603, "Missing response for %s" % payload['method']))
+            elif 'error' in item:
+                results.append(ApiException(item['error']['code'], item['error']['message']))
+            else:
+                results.append(item.get('result'))
+        return results
+
+    def batch(self, max_size=None):
+        return Batch(self, max_size=max_size)
+
     def accounts(self):
         return self._rpc_post('eth_accounts', None)
 
     def balance_at(self, address, defaultBlock='latest'):
         params = [address, defaultBlock]
-        balance = self._rpc_post('eth_getBalance', params)
-        if balance is not None:
-            return unhex(balance)
-        return 0
+        return _balance(self._rpc_post('eth_getBalance', params))
+
+    def _immutable_rpc_post(self, method, params, block_of):
+        if self.chain_cache is None:
+            return self._rpc_post(method, params)
+        return self.chain_cache.get(self.jsonrpc_url, method, params,
+                                    lambda: self._rpc_post(method, params), block_of, self.number,
+                                    lambda: self._rpc_post('eth_getBlockByNumber', ['0x0', False])['hash'])
 
     def block(self, nr, includeTransactions=False):
         params = [hex(nr).rstrip('L'), includeTransactions]
-        return self._rpc_post('eth_getBlockByNumber', params)
+        return self._immutable_rpc_post('eth_getBlockByNumber', params, _block_number)
+
+    def block_by_hash(self, blockHash, includeTransactions=False):
+        params = [blockHash, includeTransactions]
+        return self._immutable_rpc_post('eth_getBlockByHash', params, _block_number)
 
     def defaultBlock(self):
         raise DeprecationWarning('the function `defaultBlock` is deprecated, use `defaultBlock` as function argument in your request')
@@ -119,10 +405,8 @@ class Api(object):
             address = self.address
         params = [str(address), defaultBlock]
         try:
-            hexcount = self._rpc_post('eth_getTransactionCount', params)
-            if hexcount is not None:
-                count = unhex(hexcount)
-            else:
+            count = _count(self._rpc_post('eth_getTransactionCount', params))
+            if count is None:
                 return None
             logger.debug("Tx count: %s" % count)
         except Exception as e:
@@ -132,7 +416,7 @@ class Api(object):
 
     def transaction(self, transactionHash):
         params = [transactionHash]
-        return self._rpc_post('eth_getTransactionByHash', params)
+        return self._immutable_rpc_post('eth_getTransactionByHash', params, _mined_block_number)
 
     def check(self):
         raise DeprecationWarning('the method `check` is no longer available')
@@ -149,10 +433,9 @@ class Api(object):
 
     def is_contract_at(self, address, defaultBlock='latest'):
         params = [address, defaultBlock]
-        result = self._rpc_post('eth_getCode', params)
-        if result is not None:
-            return unhex(result) != 0
-        return False
+        if defaultBlock == 'pending':
+            return _has_code(self._rpc_post('eth_getCode', params))
+        return _has_code(self._immutable_rpc_post('eth_getCode', params, lambda code: True if _has_code(code) else None))
 
     def is_listening(self):
         return self._rpc_post('net_listening', None)
@@ -190,9 +473,15 @@ class Api(object):
 
     def storage_at(self, address, index, defaultBlock='latest'):
         params = [address, hex(index), defaultBlock]
-        return self._rpc_post('eth_getStorageAt', params)
+        return self._cached_rpc_post('eth_getStorageAt', params, (address, index), defaultBlock)
+
+    def _cached_rpc_post(self, method, params, key, defaultBlock):
+        if self.call_cache is None:
+            return self._rpc_post(method, params)
+        return self.call_cache.get((method,) + key, defaultBlock,
+                                   lambda: self._rpc_post(method, params), self.number)
 
-    def create(self, code, from_=None, gas=None, gas_price=None, endowment=0):
+    def create(self, code, from_=None, gas=None, gas_price=None, endowment=0, nonce=None, bump_after=None, skip=None):
         if not code.startswith('0x'):
             code = '0x' + code
         # params = [{'code': code}]
@@ -204,13 +493,7 @@ class Api(object):
         if from_ is None:
             from_ = self.address
         if not self.fixed_price:
-            net_price = self.gasprice()
-            if net_price is None:
-                gas_price = self.gas_price
-            else:
-                logger.info("    Gas price: {:.4f} szabo * {:.4f}".format(float(net_price) / 1000000000000, self.gas_price_modifier))
-                gas_price = int(net_price * self.gas_price_modifier)
-                logger.info("    Our price: %s" % "{:,}".format(gas_price))
+            gas_price = self._network_gas_price()
 
         params = [{
             'data': code,
@@ -219,15 +502,37 @@ class Api(object):
             'gasPrice': hex(gas_price).rstrip('L'),
             'value': hex(endowment).rstrip('L')
         }]
-        return self._rpc_post('eth_sendTransaction', params)
+        if bump_after:
+            return self._send_with_bumps(params, bump_after, skip)
+        return self._send_transaction(params, nonce)
+
+    # Returns the transaction hash and the address derived from the sender and nonce
+    def create_with_address(self, code, from_=None, gas=None, gas_price=None, endowment=0):
+        if from_ is None:
+            from_ = self.address
+
+        def send(nonce):
+            tx_hash = self.create(code, from_=from_, gas=gas, gas_price=gas_price, endowment=endowment, nonce=nonce)
+            return tx_hash, contract_address(from_, nonce)
+        return self.nonces(from_).send(send)
+
+    def _network_gas_price(self):
+        net_price = self.gas_prices.get(self.gasprice)
+        if net_price is None:
+            return self.gas_price
+        logger.info("    Gas price: {:.4f} szabo * {:.4f}".format(float(net_price) / 1000000000000, self.gas_price_modifier))
+        gas_price = int(net_price * self.gas_price_modifier)
+        logger.info("    Our price: %s" % "{:,}".format(gas_price))
+        return gas_price
 
     def get_contract_address(self, tx_hash):
-        receipt = self._rpc_post('eth_getTransactionReceipt', [tx_hash])
+        receipt = self._immutable_rpc_post('eth_getTransactionReceipt', [tx_hash], _mined_block_number)
         if receipt and 'contractAddress' in receipt:
             return receipt['contractAddress']
         return "0x0"
 
-    def transact(self, dest, sig=None, data=None, gas=None, gas_price=None, value=0, from_=None, fun_name=None):
+    def transact(self, dest, sig=None, data=None, gas=None, gas_price=None, value=0, from_=None, fun_name=None, nonce=None,
+                 bump_after=None, skip=None):
         if not dest.startswith('0x'):
             dest = '0x' + dest
 
@@ -245,13 +550,7 @@ class Api(object):
         if gas_price is None:
             gas_price = self.gas_price
         if not self.fixed_price:
-            net_price = self.gasprice()
-            if net_price is None:
-                gas_price = self.gas_price
-            else:
-                logger.info("    Gas price: {:.4f} szabo * {:.4f}".format(float(net_price) / 1000000000000, self.gas_price_modifier))
-                gas_price = int(net_price * self.gas_price_modifier)
-                logger.info("    Our price: %s" % "{:,}".format(gas_price))
+            gas_price = self._network_gas_price()
 
         params = [{
             'from': from_,
@@ -260,8 +559,73 @@ class Api(object):
             'gas': hex(gas).rstrip('L'),
             'gasPrice': hex(gas_price).rstrip('L'),
             'value': hex(value).rstrip('L')}]
+        if bump_after:
+            return self._send_with_bumps(params, bump_after, skip)
+        return self._send_transaction(params, nonce)
+
+    def nonces(self, address=None):
+        if address is None:
+            address = self.address
+        return NonceManager.shared(self, address)
+
+    def _send_transaction(self, params, nonce=None):
+        # Signing locally needs the nonce upfront
+        if nonce is None and (self.local_nonces or self.signer is not None):
+            return self.nonces(params[0]['from']).send(lambda nonce: self._send_transaction(params, nonce))
+        if nonce is not None:
+            params = [dict(params[0], nonce=hex(nonce).rstrip('L'))]
+        if self.signer is not None:
+            return self._rpc_post('eth_sendRawTransaction', [self.signer.sign(params[0])])
         return self._rpc_post('eth_sendTransaction', params)
 
+    # Replacements keep the nonce and raise the gas price by gas_bump, up to gas_price_cap
+    def _send_with_bumps(self, params, retry, skip=None):
+        if retry == 1:
+            retry = self.retry
+        if skip == 1:
+            skip = self.skip
+
+        gas_price = int(params[0]['gasPrice'], 16)
+        nonces = self.nonces(params[0]['from'])
+        if not self.local_nonces and self.signer is None:
+            # Other transactions get their nonces from the node, ask it for the next one
+            nonces.reset()
+        tx_hash, nonce = nonces.send(lambda nonce: (self._send_transaction(params, nonce), nonce))
+        hashes = [tx_hash]
+        waiter = TransactionWaiter(self)
+        waiter.add(tx_hash)
+        start_time = sent_time = time.time()
+
+        while True:
+            if self._wait_tick():
+                for tx_hash, receipt in waiter.check():
+                    if len(hashes) > 1:
+                        logger.info("    Mined %s, replacing %s" % (tx_hash, ", ".join(h for h in hashes if h != tx_hash)))
+                    return tx_hash
+
+            now = time.time()
+            if skip and now - start_time > skip:
+                logger.info(" Took too long, " + colors.FAIL + "skipping" + colors.ENDC + "...")
+                return hashes[-1]
+            if not retry or now - sent_time <= retry:
+                continue
+            sent_time = now
+
+            bumped = min(int(gas_price * self.gas_bump), self.gas_price_cap)
+            if bumped <= gas_price:
+                continue
+            try:
+                tx_hash = self._send_transaction([dict(params[0], gasPrice=hex(bumped).rstrip('L'))], nonce)
+            except ApiException as e:
+                # Usually one of the transactions was just mined and took the nonce
+                logger.info("    Replacing %s failed: %s" % (hashes[-1], e))
+                continue
+            logger.info(" Took too long, " + colors.WARNING + "resending" + colors.ENDC +
+                        " with gas price %s: %s" % ("{:,}".format(bumped), tx_hash))
+            gas_price = bumped
+            hashes.append(tx_hash)
+            waiter.add(tx_hash)
+
     def call(self, dest, sig=None, data=None, gas=None, gas_price=None, value=0, from_=None, defaultBlock='latest', fun_name=None):
         if not dest.startswith('0x'):
             dest = '0x' + dest
@@ -279,14 +643,6 @@ class Api(object):
             gas = self.gas
         if gas_price is None:
             gas_price = self.gas_price
-        if not self.fixed_price:
-            net_price = self.gasprice()
-            if net_price is None:
-                gas_price = self.gas_price
-            else:
-                logger.info("    Gas price: {:.4f} szabo * {:.4f}".format(float(net_price) / 1000000000000, self.gas_price_modifier))
-                gas_price = int(net_price * self.gas_price_modifier)
-                logger.info("    Our price: %s" % "{:,}".format(gas_price))
 
         params = [{
             'from': from_,
@@ -295,11 +651,44 @@ class Api(object):
             'gas': hex(gas).rstrip('L'),
             'gasPrice': hex(gas_price).rstrip('L'),
             'value': hex(value).rstrip('L')}, defaultBlock]
-        r = self._rpc_post('eth_call', params)
+        r = self._cached_rpc_post('eth_call', params, (dest, data, from_, value), defaultBlock)
         if r is not None:
+            if sig is not None:
+                return compile_signature(sig).decode(r)
             return decode_datalist(r[2:].decode('hex'))
         return []
 
+    # In filter mode, returns False when no new block arrived within a second
+    def _wait_tick(self, defaultBlock='latest'):
+        if self.wait_mode == 'filter' and defaultBlock != 'pending':
+            if self._block_filter is None:
+                block_filter = BlockFilter.shared(self, self.filter_interval)
+                with block_filter._lock:
+                    if block_filter.supported and block_filter.filter_id is None:
+                        try:
+                            block_filter.install()
+                        except ApiException as e:
+                            logger.info("Block filters not supported, polling instead: %s" % e)
+                            block_filter.supported = False
+                    self._seen_blocks = block_filter.blocks
+                if block_filter.supported:
+                    self._block_filter = block_filter
+                    return True  # the filter only reports blocks from now on, check right away
+                self.wait_mode = 'poll'
+            if self.wait_mode == 'filter':
+                seen = self._block_filter.wait(1, self._seen_blocks)
+                if seen > self._seen_blocks:
+                    self._seen_blocks = seen
+                    self.gas_prices.invalidate()
+                    if self.call_cache is not None:
+                        self.call_cache.invalidate()
+                    return True
+                return False
+        time.sleep(1)
+        if self.call_cache is not None:
+            self.call_cache.invalidate()
+        return True
+
     def wait_for_contract(self, address, defaultBlock='latest', retry=None, skip=None, verbose=False):
         if retry == 1:
             retry = self.retry
@@ -322,9 +711,7 @@ class Api(object):
             if verbose:
                 sys.stdout.write('.')
                 sys.stdout.flush()
-            time.sleep(1)
-            codeat = self.is_contract_at(address, defaultBlock)
-            if codeat:
+            if self._wait_tick(defaultBlock) and self.is_contract_at(address, defaultBlock):
                 break
 
             delta = time.time() - start_time
@@ -365,16 +752,16 @@ class Api(object):
             if verbose:
                 sys.stdout.write('.')
                 sys.stdout.flush()
-            time.sleep(1)
-            result = self.transaction(transactionHash)  # no defaultBlock, check result instead
-            logger.debug("Transaction result: %s" % result)
-            if isinstance(result, dict):
-                if result['blockNumber'] is not None:
-                    break
-                if defaultBlock == 'pending' and result['blockNumber'] is None:
-                    break
-            elif result == "0x01":  # For test_deploy's mocked RPC.. TODO make sure there's no side effects
-                return result
+            if self._wait_tick(defaultBlock):
+                result = self.transaction(transactionHash)  # no defaultBlock, check result instead
+                logger.debug("Transaction result: %s" % result)
+                if isinstance(result, dict):
+                    if result['blockNumber'] is not None:
+                        break
+                    if defaultBlock == 'pending' and result['blockNumber'] is None:
+                        break
+                elif result == "0x01":  # For test_deploy's mocked RPC.. TODO make sure there's no side effects
+                    return result
 
             delta = time.time() - start_time
 
@@ -416,9 +803,7 @@ class Api(object):
             if verbose:
                 sys.stdout.write('.')
                 sys.stdout.flush()
-            time.sleep(1)
-            block = self.last_block()
-            if block != last_block:
+            if self._wait_tick() and self.last_block() != last_block:
                 break
 
             delta = time.time() - start_time
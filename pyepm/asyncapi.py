@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from concurrent import futures
+
+from api import Api
+
+logger = logging.getLogger(__name__)
+
+class _Wait(object):
+    def __init__(self, future, check, retry, skip):
+        self.future = future
+        self.check = check
+        self.retry = retry
+        self.skip = skip
+        self.start_time = time.time()
+        self.pending = None
+
+    def expired(self):
+        """Returns the wait's result if one of its deadlines passed, None otherwise"""
+        delta = time.time() - self.start_time
+        if self.skip and delta > self.skip:
+            logger.info("Took too long, skipping...")
+            return True
+        if self.retry and delta > self.retry:
+            logger.info("Took too long, retrying...")
+            return False
+        return None
+
+    def resolve(self, result=None, exception=None):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        if exception is not None:
+            self.future.set_exception(exception)
+        else:
+            self.future.set_result(result)
+
+
+class AsyncApi(object):
+    """Non-blocking mirror of `Api`
+
+    Every RPC method returns a `concurrent.futures.Future` and runs on a
+    bounded pool of `max_in_flight` threads sharing the same pooled transport.
+    The `wait_for_*` helpers don't hold a thread while waiting: a single
+    poller thread checks all outstanding waits once per `poll_interval`,
+    and a wait can be cancelled at any time with `future.cancel()`.
+    """
+
+    def __init__(self, config, max_in_flight=None, poll_interval=1, transport=None):
+        self.api = Api(config, transport=transport)
+        if max_in_flight is None:
+            max_in_flight = config.getint('api', 'max_in_flight')
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.executor = futures.ThreadPoolExecutor(max_workers=max_in_flight)
+
+        self._waits = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._poller = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.shutdown()
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        self._stopped.set()
+        with self._lock:
+            waits, self._waits = self._waits, []
+        for w in waits:
+            w.future.cancel()
+        if self._poller is not None and wait:
+            self._poller.join()
+        self.executor.shutdown(wait=wait)
+
+    def _mirror(name):
+        def method(self, *args, **kwargs):
+            return self.executor.submit(getattr(self.api, name), *args, **kwargs)
+        method.__name__ = name
+        method.__doc__ = "Asynchronous `Api.%s`, returns a Future" % name
+        return method
+
+    accounts = _mirror('accounts')
+    balance_at = _mirror('balance_at')
+    block = _mirror('block')
+    transaction_count = _mirror('transaction_count')
+    transaction = _mirror('transaction')
+    coinbase = _mirror('coinbase')
+    gasprice = _mirror('gasprice')
+    is_contract_at = _mirror('is_contract_at')
+    is_listening = _mirror('is_listening')
+    is_mining = _mirror('is_mining')
+    last_block = _mirror('last_block')
+    lll = _mirror('lll')
+    logs = _mirror('logs')
+    number = _mirror('number')
+    peer_count = _mirror('peer_count')
+    storage_at = _mirror('storage_at')
+    create = _mirror('create')
+    get_contract_address = _mirror('get_contract_address')
+    transact = _mirror('transact')
+    call = _mirror('call')
+
+    del _mirror
+
+    def wait_for_contract(self, address, defaultBlock='latest', retry=None, skip=None):
+        def check():
+            return self.api.is_contract_at(address, defaultBlock)
+        return self._wait(check, retry, skip)
+
+    def wait_for_transaction(self, transactionHash, defaultBlock='latest', retry=None, skip=None):
+        def check():
+            result = self.api.transaction(transactionHash)
+            if isinstance(result, dict):
+                return result['blockNumber'] is not None or defaultBlock == 'pending'
+            return False
+        return self._wait(check, retry, skip)
+
+    def wait_for_next_block(self, from_block=None, retry=None, skip=None):
+        state = {'last_block': from_block}
+
+        def check():
+            block = self.api.last_block()
+            if state['last_block'] is None:
+                state['last_block'] = block
+                return False
+            return block != state['last_block']
+        return self._wait(check, retry, skip)
+
+    def _wait(self, check, retry, skip):
+        if retry == 1:
+            retry = self.api.retry
+        if skip == 1:
+            skip = self.api.skip
+
+        future = futures.Future()
+        with self._lock:
+            if self._stopped.is_set():
+                raise RuntimeError("cannot wait after shutdown")
+            self._waits.append(_Wait(future, check, retry, skip))
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name="AsyncApi poller")
+                self._poller.daemon = True
+                self._poller.start()
+        return future
+
+    def _poll(self):
+        while not self._stopped.is_set():
+            tick = time.time()
+            with self._lock:
+                waits = [w for w in self._waits if not w.future.cancelled()]
+                self._waits = waits
+
+            # Check every outstanding wait concurrently, at most one RPC in flight per wait
+            for w in waits:
+                if w.pending is None:
+                    w.pending = self.executor.submit(w.check)
+            if waits:
+                futures.wait([w.pending for w in waits], timeout=self.poll_interval)
+
+            done = set()
+            for w in waits:
+                if not w.pending.done():
+                    continue
+                pending, w.pending = w.pending, None
+                exception = pending.exception()
+                if exception is not None:
+                    w.resolve(exception=exception)
+                    done.add(w)
+                elif pending.result():
+                    w.resolve(True)
+                    done.add(w)
+                else:
+                    expired = w.expired()
+                    if expired is not None:
+                        w.resolve(expired)
+                        done.add(w)
+
+            if done:
+                with self._lock:
+                    self._waits = [w for w in self._waits if w not in done]
+
+            self._stopped.wait(max(self.poll_interval - (time.time() - tick), 0))
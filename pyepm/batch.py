@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import itertools
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+
+from api import ApiException, TransactionWaiter, abi_data
+from colors import colors
+from plan import normalize_data
+
+logger = logging.getLogger(__name__)
+
+INTEGER = re.compile(r'^-?\d+$')
+
+def read_rows(path, columns=None):
+    """Yields the rows of a CSV file with a header line, or of a JSON lines file, as lists of values"""
+    with open(path) as f:
+        if path.endswith('.csv'):
+            reader = csv.reader(f)
+            header = next(reader, [])
+            indexes = [header.index(column) for column in columns] if columns else range(len(header))
+            for row in reader:
+                if row:
+                    yield [int(row[i]) if INTEGER.match(row[i]) else row[i] for i in indexes]
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line, object_pairs_hook=OrderedDict)
+                if isinstance(row, dict):
+                    row = [row[column] for column in columns] if columns else row.values()
+                yield row
+
+class BatchSender(object):
+    """Sends a transaction for each row of a stream, with at most `window` unconfirmed at a time"""
+
+    def __init__(self, api, window=500, skip=None, progress=5, checkpoint=None):
+        self.api = api
+        self.window = window
+        self.progress = progress
+        self.checkpoint = checkpoint
+        self.waiter = TransactionWaiter(api, skip=skip)
+        self.sent = 0
+        self.mined = 0
+        self.failed = 0
+        self.unconfirmed = 0
+        self.start_time = None
+        self.reported = 0
+        self.transactions = {}
+        self.settled = set()
+        self.done = 0
+        self.new = []
+
+    def run(self, rows, to, sig, from_, gas, gas_price, value, wait=True, resume=None):
+        """Sends all `rows` as data to `to` with `sig`, returns the counts of sent, mined and failed transactions"""
+        self.start_time = self.reported = time.time()
+        watched = self._resume(resume) if resume else set()
+        nonces = self.api.nonces(from_)
+        if not self.api.fixed_price:
+            gas_price = self.api._network_gas_price()
+        template = {
+            'from': from_,
+            'to': to if to.startswith('0x') else '0x' + to,
+            'gas': hex(gas).rstrip('L'),
+            'gasPrice': hex(gas_price).rstrip('L'),
+            'value': hex(value).rstrip('L')
+        }
+
+        rows = ((i, row) for i, row in enumerate(rows) if i >= self.done and i not in watched)
+        retries = []
+        retried = set()
+        while True:
+            chunk = retries[:self.api.batch_size]
+            retries = retries[len(chunk):]
+            chunk.extend(itertools.islice(rows, self.api.batch_size - len(chunk)))
+            if not chunk:
+                break
+            self._confirm(self.window - len(chunk))
+            sent = [nonces.next() for _ in chunk]
+            batch = self.api.batch()
+            batch.send_transactions([dict(template, data=abi_data(sig, normalize_data(row, [])), nonce=hex(nonce).rstrip('L'))
+                                     for nonce, (_, row) in zip(sent, chunk)])
+            too_low = False
+            for nonce, (i, row), result in zip(sent, chunk, batch.execute()):
+                if isinstance(result, ApiException) and 'nonce too low' in str(result).lower() and i not in retried:
+                    retries.append((i, row))
+                    retried.add(i)
+                    too_low = True
+                elif isinstance(result, ApiException):
+                    logger.warn("    Transaction with nonce %d failed: %s" % (nonce, result))
+                    nonces.release(nonce)
+                    self.failed += 1
+                    self._settle(i)
+                else:
+                    self.waiter.add(result)
+                    self.transactions[result] = (i, nonce)
+                    self.new.append([i, result, nonce])
+                    self.sent += 1
+            if too_low:
+                logger.info("    Nonce too low for %s, resyncing" % from_)
+                nonces.sync()
+            self._checkpoint()
+            self._report()
+
+        gaps = nonces.released()
+        if gaps:
+            self._drop_stuck(gaps[0])
+            nonces.sync()
+        if wait:
+            self._confirm(0)
+        self._checkpoint()
+        self._report(True)
+        return {'sent': self.sent, 'mined': self.mined, 'failed': self.failed, 'unconfirmed': self.unconfirmed}
+
+    def _resume(self, checkpoints):
+        """Restores the progress of an interrupted run, returns the rows whose transactions are watched"""
+        self.done = checkpoints[-1]['rows']
+        sent = [entry for checkpoint in checkpoints for entry in checkpoint['sent'] if entry[0] >= self.done]
+        watched = set()
+        if sent:
+            batch = self.api.batch()
+            for _, tx_hash, _ in sent:
+                batch.transaction(tx_hash)
+            for (i, tx_hash, nonce), transaction in zip(sent, batch.execute()):
+                if transaction and not isinstance(transaction, ApiException):
+                    self.waiter.add(tx_hash)
+                    self.transactions[tx_hash] = (i, nonce)
+                    self.sent += 1
+                    watched.add(i)
+        logger.info("    Resuming at row %d, watching %d transactions already sent" % (self.done, len(watched)))
+        return watched
+
+    def _drop_stuck(self, gap):
+        """Stops waiting for the transactions that can't be mined because of the unused nonce `gap`"""
+        stuck = [tx_hash for tx_hash in list(self.waiter.pending) if self.transactions[tx_hash][1] > gap]
+        for tx_hash in stuck:
+            self.waiter.remove(tx_hash)
+            self.unconfirmed += 1
+            self._settle(self.transactions[tx_hash][0])
+        if stuck:
+            logger.warn("    %d transactions after rejected nonce %d can't be mined" % (len(stuck), gap))
+
+    def _settle(self, i):
+        self.settled.add(i)
+        while self.done in self.settled:
+            self.settled.remove(self.done)
+            self.done += 1
+
+    def _checkpoint(self):
+        """Reports that the first `rows` are done, and the [row, tx_hash, nonce] sent since the last checkpoint"""
+        if self.checkpoint is not None:
+            self.checkpoint({'rows': self.done, 'sent': self.new})
+        self.new = []
+
+    def _confirm(self, limit):
+        """Waits until at most `limit` transactions are unconfirmed"""
+        while len(self.waiter) > max(limit, 0):
+            self.api._wait_tick()
+            for tx_hash, receipt in self.waiter.check():
+                if receipt:
+                    self.mined += 1
+                else:
+                    self.unconfirmed += 1
+                self._settle(self.transactions[tx_hash][0])
+            self._report()
+
+    def _report(self, done=False):
+        now = time.time()
+        if not done and now - self.reported < self.progress:
+            return
+        self.reported = now
+        elapsed = max(now - self.start_time, 0.001)
+        logger.info("    Sent " + colors.BOLD + "%d" % self.sent + colors.ENDC +
+                    ", mined " + colors.BOLD + "%d" % self.mined + colors.ENDC +
+                    ", failed %d (%.1f tx/s)" % (self.failed, self.sent / elapsed))
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class LRUCache(object):
+    """Thread-safe mapping bounded to the `size` most recently used entries"""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+
+class GasPriceCache(object):
+    """Caches the network gas price for `ttl` seconds"""
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, ttl=10):
+        self.ttl = ttl
+        self.price = None
+        self.expires = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, url, ttl):
+        """Return the process-wide gas price cache for `url` and `ttl`"""
+        key = (url, ttl)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(ttl)
+            return cls._shared[key]
+
+    def get(self, fetch):
+        """Returns the cached price, calling `fetch()` when it expired"""
+        with self._lock:
+            if self.price is not None and time.time() < self.expires:
+                self.hits += 1
+                return self.price
+            self.misses += 1
+            self.price = fetch()
+            self.expires = time.time() + self.ttl
+            return self.price
+
+    def invalidate(self):
+        with self._lock:
+            self.price = None
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class CallCache(object):
+    """Caches `eth_call` and `eth_getStorageAt` results by block, never at `pending`"""
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+    _missing = object()
+
+    def __init__(self, size=1024, interval=1):
+        self.interval = interval
+        self.head = None
+        self.checked = 0
+        self.latest = LRUCache(size)
+        self.fixed = LRUCache(size)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, url, size, interval):
+        """Return the process-wide call cache for `url` and these settings"""
+        key = (url, size, interval)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(size, interval)
+            return cls._shared[key]
+
+    def _head(self, fetch_head):
+        with self._lock:
+            if time.time() - self.checked >= self.interval:
+                head = fetch_head()
+                self.checked = time.time()
+                if head != self.head:
+                    if self.head is not None:
+                        logger.debug("New head %s, dropping %d cached results" % (head, len(self.latest)))
+                    self.latest.clear()
+                    self.head = head
+            return self.head
+
+    def invalidate(self):
+        """Checks the head block number again on the next `latest` lookup"""
+        with self._lock:
+            self.checked = 0
+
+    def get(self, key, defaultBlock, fetch, fetch_head):
+        """Returns the cached result for `key` at `defaultBlock`, calling `fetch()` on a miss"""
+        if defaultBlock == 'latest':
+            cache = self.latest
+            key = key + (self._head(fetch_head),)
+        elif isinstance(defaultBlock, (int, long)):
+            cache = self.fixed
+            key = key + (defaultBlock,)
+        elif isinstance(defaultBlock, basestring) and defaultBlock.startswith('0x'):
+            cache = self.fixed
+            key = key + (int(defaultBlock, 16),)
+        else:
+            return fetch()
+
+        result = cache.get(key, self._missing)
+        if result is self._missing:
+            result = fetch()
+            cache.set(key, result)
+        return result
+
+    def stats(self):
+        return {
+            'hits': self.latest.hits + self.fixed.hits,
+            'misses': self.latest.misses + self.fixed.misses,
+            'size': len(self.latest) + len(self.fixed),
+            'head': self.head
+        }
+
+
+class ChainCache(object):
+    """SQLite cache of chain data that doesn't change once confirmed, keyed by genesis block, method and params"""
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path, size, confirmations=12, interval=1):
+        self.path = path
+        self.size = size
+        self.confirmations = confirmations
+        self.interval = interval
+        self.hits = 0
+        self.misses = 0
+        self.nodes = {}
+        self._lock = threading.RLock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=OFF")
+        self.db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                        "key TEXT PRIMARY KEY, value TEXT, block INTEGER, size INTEGER, accessed REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self.db.commit()
+        self.total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @classmethod
+    def shared(cls, path, size, confirmations):
+        with cls._shared_lock:
+            if path not in cls._shared:
+                cls._shared[path] = cls(path, size, confirmations)
+            return cls._shared[path]
+
+    def _node(self, url, fetch_genesis):
+        if url not in self.nodes:
+            self.nodes[url] = {'genesis': fetch_genesis(), 'head': None, 'checked': 0}
+        return self.nodes[url]
+
+    def _head(self, node, fetch_head):
+        if node['head'] is None or time.time() - node['checked'] >= self.interval:
+            node['head'] = fetch_head()
+            node['checked'] = time.time()
+        return node['head']
+
+    def get(self, url, method, params, fetch, block_of, fetch_head, fetch_genesis):
+        """Returns `fetch()` on `url`, from disk once confirmed, `block_of(result)` is its block, True for the head or None"""
+        with self._lock:
+            node = self._node(url, fetch_genesis)
+            key = hashlib.sha256(json.dumps([node['genesis'], method, params], sort_keys=True)).hexdigest()
+            row = self.db.execute("SELECT value, block FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] <= self._head(node, fetch_head) - self.confirmations:
+                self.db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+                self.hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+
+        result = fetch()
+        block = block_of(result)
+        value = json.dumps(result)
+        if block is None:
+            if row is not None:
+                # Not mined or not there anymore, the entry was reorganized away
+                with self._lock:
+                    self._delete(key)
+                    self.db.commit()
+            return result
+
+        with self._lock:
+            if block is True:
+                if row is not None and row[0] == value:
+                    return result  # keep the block it was first seen at
+                block = self._head(node, fetch_head)
+            previous = self.db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self.total += len(value) - (previous[0] if previous else 0)
+            self.db.execute("INSERT OR REPLACE INTO entries (key, value, block, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                            (key, value, block, len(value), time.time()))
+            self._evict()
+            self.db.commit()
+        return result
+
+    def _delete(self, key):
+        previous = self.db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if previous is not None:
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.total -= previous[0]
+
+    def _evict(self):
+        if self.total <= self.size:
+            return
+        target = self.total - self.size * 0.9
+        freed = 0
+        keys = []
+        for key, size in self.db.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            keys.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        self.db.executemany("DELETE FROM entries WHERE key = ?", keys)
+        self.total -= freed
+        logger.debug("Evicted %d entries from %s" % (len(keys), self.path))
+
+    def stats(self):
+        with self._lock:
+            count, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': count, 'bytes': size}
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import binascii
+import logging
+
+from ethereum import abi
+from serpent import get_prefix
+from cache import LRUCache
+from utils import unhex
+
+logger = logging.getLogger(__name__)
+
+def _int_encoder(typ):
+    base, sub, _ = typ
+    bits = int(sub)
+    low = 0 if base == 'uint' else -2 ** (bits - 1)
+    high = 2 ** bits
+    modulus = 2 ** bits
+
+    def encode(arg):
+        if type(arg) not in (int, long):
+            return abi.encode_single(typ, arg).encode('hex')
+        if not low <= arg < high:
+            raise abi.ValueOutOfBounds(repr(arg))
+        return '%064x' % (arg % modulus)
+    return encode
+
+def _static_encoder(typ):
+    def encode(arg):
+        return abi.enc(typ, arg).encode('hex')
+    return encode
+
+def _words(data):
+    """Splits hex `data` in 32-byte unsigned ints, like serpent's `decode_datalist`"""
+    return [int(data[i:i + 64], 16) for i in xrange(0, len(data), 64)]
+
+def _word_decoder(typ):
+    """Decoder of a static scalar type from one 64 hex digits word, None if unsupported"""
+    base, sub, arrlist = typ
+    if arrlist:
+        return None
+    if base == 'uint':
+        return lambda word: int(word, 16)
+    if base == 'int':
+        bits = int(sub)
+        high = 2 ** (bits - 1)
+        modulus = 2 ** bits
+
+        def decode(word):
+            value = int(word, 16)
+            return value - modulus if value >= high else value
+        return decode
+    if base == 'address':
+        return lambda word: word[24:]
+    if base == 'bool':
+        return lambda word: int(word, 16) != 0
+    if base in ('bytes', 'string', 'hash') and sub:
+        size = int(sub)
+        return lambda word: binascii.unhexlify(word[:size * 2])
+    return None
+
+def _static_decoder(decoders):
+    size = 64 * len(decoders)
+
+    def decode(data):
+        if len(data) != size:
+            return _words(data)
+        return [decoder(data[64 * i:64 * (i + 1)]) for i, decoder in enumerate(decoders)]
+    return decode
+
+def _array_decoder(decoder):
+    def decode(data):
+        # Fall back to plain words for anything not laid out as a single ABI array
+        if len(data) < 128 or int(data[:64], 16) != 32:
+            return _words(data)
+        length = int(data[64:128], 16)
+        if len(data) != 128 + 64 * length:
+            return _words(data)
+        return [decoder(data[i:i + 64]) for i in xrange(128, len(data), 64)]
+    return decode
+
+def _bytes_decoder(data):
+    if len(data) < 128 or int(data[:64], 16) != 32:
+        return _words(data)
+    length = int(data[64:128], 16)
+    if len(data) < 128 + 2 * length:
+        return _words(data)
+    return [binascii.unhexlify(str(data)[128:128 + 2 * length])]
+
+def _abi_decoder(types):
+    def decode(data):
+        try:
+            return abi.decode_abi(types, binascii.unhexlify(data))
+        except (AssertionError, abi.EncodingError, IndexError, ValueError, TypeError):
+            return _words(data)
+    return decode
+
+def _decoder(outputs):
+    """Builds the decoder of `eth_call` results, from hex data without `0x`"""
+    try:
+        proctypes = [abi.process_type(t) for t in outputs]
+    except AssertionError:
+        return _words
+    if not proctypes:
+        return _words
+
+    decoders = [_word_decoder(t) for t in proctypes]
+    if all(decoders):
+        return _static_decoder(decoders)
+
+    if len(proctypes) == 1:
+        base, sub, arrlist = proctypes[0]
+        if arrlist == [[]]:
+            decoder = _word_decoder((base, sub, []))
+            if decoder is not None:
+                return _array_decoder(decoder)
+        elif base in ('bytes', 'string') and not sub and not arrlist:
+            return _bytes_decoder
+
+    if all(t[0] in ('int', 'uint', 'address', 'bool', 'bytes', 'string', 'hash') for t in proctypes):
+        return _abi_decoder(outputs)
+    return _words
+
+class Signature(object):
+    """A serpent `name:[types]:return` signature, parsed once
+
+    Keeps the 4-byte method prefix, the input and output types, an encoder
+    specialized for the input types and a decoder for the output types.
+    """
+
+    __slots__ = ('sig', 'name', 'prefix', 'types', 'outputs', 'encoders', 'decoder')
+
+    def __init__(self, sig):
+        self.sig = sig
+        parts = sig.split(':')
+        self.name = parts[0]
+        self.types = [t for t in parts[1][1:-1].split(',') if t]
+        self.outputs = [t for t in parts[2].split(',') if t] if len(parts) > 2 else []
+        self.prefix = '0x%08x' % get_prefix(sig)
+
+        # Static types are encoded one by one, int types without going through bytes.
+        # Anything dynamic goes through the generic head/tail encoder.
+        self.encoders = None
+        proctypes = [abi.process_type(t) for t in self.types]
+        if all(abi.get_size(t) is not None for t in proctypes):
+            self.encoders = [_int_encoder(t) if t[0] in ('int', 'uint') and not t[2] else _static_encoder(t)
+                             for t in proctypes]
+
+        self.decoder = _decoder(self.outputs)
+
+    def encode(self, data):
+        data = [unhex(d) if isinstance(d, basestring) and d[:2] == "0x" else d for d in data or []]
+        if self.encoders is not None and len(data) == len(self.encoders):
+            return self.prefix + ''.join([encode(d) for encode, d in zip(self.encoders, data)])
+        return self.prefix + abi.encode_abi(self.types, data).encode('hex')
+
+    def decode(self, result):
+        """Decodes an `eth_call` hex result according to the output types
+
+        Results that don't match the output types are returned as a list of
+        32-byte words, like serpent's `decode_datalist`.
+        """
+        if result[:2] == '0x':
+            result = result[2:]
+        if not result:
+            return []
+        return self.decoder(result)
+
+_signatures = LRUCache(256)
+
+def compile_signature(sig):
+    """Returns the memoized `Signature` for `sig`"""
+    signature = _signatures.get(sig)
+    if signature is None:
+        signature = Signature(sig)
+        _signatures.set(sig, signature)
+    return signature
+
+def stats():
+    return _signatures.stats()
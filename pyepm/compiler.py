@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent import futures
+from distutils import spawn
+
+import serpent
+from utils import config_dir
+
+logger = logging.getLogger(__name__)
+
+SERPENT_INCLUDES = re.compile(r'''(?:inset|create)\(\s*["']([^"']+)["']\s*\)''')
+SOLIDITY_INCLUDES = re.compile(r'''import\s+["']([^"']+)["']''')
+
+def sources(paths, includes):
+    """Returns (path, content) of source files and everything they include, recursively"""
+    found = []
+    visited = set()
+    todo = [paths] if isinstance(paths, basestring) else list(paths)
+    while todo:
+        path = todo.pop(0)
+        if path in visited:
+            continue
+        visited.add(path)
+        with open(path) as f:
+            content = f.read()
+        found.append((path, content))
+        for include in includes.findall(content):
+            # Includes may be relative to the file or to the working directory
+            for candidate in (os.path.join(os.path.dirname(path), include), include):
+                if os.path.exists(candidate):
+                    todo.append(os.path.normpath(candidate))
+                    break
+    return found
+
+def serpent_version():
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution('ethereum-serpent').version
+    except Exception:
+        return 'unknown'
+
+_solc_version = []
+
+def solc_version():
+    if not _solc_version:
+        _solc_version.append(subprocess.check_output(["solc", "--version"]).strip())
+    return _solc_version[0]
+
+def compile_serpent(path):
+    code = open(path).read()
+    return {
+        'contracts': [[None, serpent.compile(code).encode('hex')]],
+        'signatures': serpent.mk_full_signature(code)
+    }
+
+def compile_solidity(paths, contract_names):
+    """Compiles one or more Solidity files with a single solc run, reading its combined JSON output"""
+    if isinstance(paths, basestring):
+        paths = [paths]
+    process = subprocess.Popen(["solc", "--combined-json", "abi,bin"] + list(paths),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, error = process.communicate()
+    if process.returncode:
+        raise Exception("solc failed: %s" % error.strip())
+
+    # Contracts are keyed by name, or by `path:name` in newer solc versions
+    compiled = {}
+    for name, contract in json.loads(output)['contracts'].items():
+        compiled[name.split(':')[-1]] = contract
+
+    contracts = []
+    signatures = {}
+    for contract_name in contract_names:
+        if contract_name not in compiled:
+            raise Exception("Contract %s not found in %s" % (contract_name, ", ".join(paths)))
+        contract = compiled[contract_name]
+        contracts.append([contract_name, "0x" + contract.get('bin', contract.get('binary', ''))])
+        abi = contract.get('abi', contract.get('json-abi'))
+        signatures[contract_name] = json.loads(abi) if isinstance(abi, basestring) else abi
+    return {'contracts': contracts, 'signatures': signatures}
+
+
+def _job_key(kind, path, contract_names):
+    return (kind, path if isinstance(path, basestring) else tuple(path), tuple(contract_names or []))
+
+
+class CompileCache(object):
+    """Compiler output stored in `path`, keyed by a hash of the sources and compiler
+
+    Keeps the `size` most recently used entries.
+    """
+
+    def __init__(self, path, size):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def key(self, compiler, version, options, sources):
+        h = hashlib.sha256()
+        h.update(json.dumps([compiler, version, options]))
+        for path, content in sources:
+            h.update(hashlib.sha256(content).digest())
+        return h.hexdigest()
+
+    def get(self, key):
+        filename = os.path.join(self.path, "%s.json" % key)
+        try:
+            with open(filename) as f:
+                result = json.load(f)
+        except (IOError, ValueError):
+            self.misses += 1
+            return None
+        os.utime(filename, None)
+        self.hits += 1
+        return result
+
+    def set(self, key, result):
+        filename = os.path.join(self.path, "%s.json" % key)
+        tmp = "%s.%s.tmp" % (filename, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(result, f)
+        os.rename(tmp, filename)
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = [os.path.join(self.path, f) for f in os.listdir(self.path) if f.endswith('.json')]
+            if len(entries) <= self.size:
+                return
+            entries.sort(key=lambda f: os.path.getmtime(f))
+            for filename in entries[:len(entries) - self.size]:
+                try:
+                    os.remove(filename)
+                    self.evictions += 1
+                except OSError:
+                    pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class Compiler(object):
+    """Compiles serpent and Solidity contracts, through a `CompileCache` when enabled
+
+    `start(jobs)` compiles ahead of time in a pool of `workers` processes
+    (one per core by default) while the caller goes on, `wait()` then
+    raises the first compile error. Later `serpent()` and `solidity()`
+    calls for those contracts return the precompiled output.
+    """
+
+    def __init__(self, config):
+        self.cache = None
+        size = config.getint('misc', 'compile_cache_size')
+        if size:
+            self.cache = CompileCache(os.path.join(config_dir.path, 'compiled'), size)
+        self.workers = config.getint('deploy', 'compile_workers') or multiprocessing.cpu_count()
+        self.compiled = {}
+        self.pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _job(self, kind, path, contract_names):
+        """Returns the cache key and compile function of a job"""
+        if kind == 'serpent':
+            key = None
+            if self.cache is not None:
+                key = self.cache.key('serpent', serpent_version(), [], sources(path, SERPENT_INCLUDES))
+            return key, compile_serpent, (path,)
+        if not spawn.find_executable("solc"):
+            raise Exception("solc compiler not found")
+        key = None
+        if self.cache is not None:
+            key = self.cache.key('solc', solc_version(), contract_names, sources(path, SOLIDITY_INCLUDES))
+        return key, compile_solidity, (path, contract_names)
+
+    def _compile(self, kind, path, contract_names=None):
+        job = _job_key(kind, path, contract_names)
+        with self._lock:
+            pending = self.pending.pop(job, None)
+        if pending is not None:
+            return self._finish(job, pending)
+        if job in self.compiled:
+            return self.compiled[job]
+
+        key, compile, args = self._job(kind, path, contract_names)
+        result = self.cache.get(key) if key is not None else None
+        if result is None:
+            result = compile(*args)
+            if key is not None:
+                self.cache.set(key, result)
+        else:
+            logger.debug("Using cached %s output for %s" % (kind, path))
+        return result
+
+    def _finish(self, job, pending):
+        key, future = pending
+        try:
+            result = future.result()
+        except Exception as e:
+            raise Exception("Failed to compile %s: %s" % (job[1], e))
+        if key is not None:
+            self.cache.set(key, result)
+        self.compiled[job] = result
+        return result
+
+    def start(self, jobs):
+        """Compiles `jobs` of (kind, path, contract names) in the background
+
+        Cached contracts are loaded right away, the others are submitted to
+        the process pool.
+        """
+        missing = []
+        for kind, path, contract_names in jobs:
+            job = _job_key(kind, path, contract_names)
+            if job in self.compiled or job in self.pending:
+                continue
+            key, compile, args = self._job(kind, path, contract_names)
+            result = self.cache.get(key) if key is not None else None
+            if result is not None:
+                self.compiled[job] = result
+            else:
+                missing.append((job, key, compile, args))
+        if not missing:
+            return
+
+        logger.debug("Compiling %d contracts with %d processes" % (len(missing), min(self.workers, len(missing))))
+        executor = futures.ProcessPoolExecutor(max_workers=min(self.workers, len(missing)))
+        with self._lock:
+            for job, key, compile, args in missing:
+                self.pending[job] = (key, executor.submit(compile, *args))
+        executor.shutdown(wait=False)
+
+    def wait(self):
+        """Waits for every contract submitted by `start`, raising the first compile error"""
+        with self._lock:
+            pending, self.pending = self.pending, OrderedDict()
+        for job, (key, future) in pending.items():
+            self._finish(job, (key, future))
+
+    def serpent(self, path):
+        """Returns the hex code of a serpent contract"""
+        return self._compile('serpent', path)['contracts'][0][1]
+
+    def solidity(self, path, contract_names):
+        """Returns [(name, code)] of the named contracts in one or a list of Solidity files"""
+        result = self._compile('solidity', path, contract_names)
+        return [(name, code) for name, code in result['contracts']]
+
+    def stats(self):
+        if self.cache is None:
+            return None
+        return self.cache.stats()
@@ -23,18 +23,108 @@ config_template = """
 host = 127.0.0.1
 port = 8545
 address = 0xcd2a3d9f938e13cd947ec05abc7fe734df8dd826
+# HTTP connection pool size, keep-alive and timeouts (in seconds, 0 to disable)
+pool_size = 10
+keep_alive = True
+connect_timeout = 5
+read_timeout = 60
+# Maximum number of calls per JSON RPC batch request
+batch_size = 100
+# Maximum number of concurrent RPCs for AsyncApi (keep at or below pool_size)
+max_in_flight = 10
+# Wait for transactions and contracts by polling every second (poll)
+# or by checking on each new block from a block filter (filter)
+wait = poll
+filter_interval = 0.25
+# Number of eth_call and eth_getStorageAt results to cache (0 to disable).
+# Results at 'latest' are dropped when the head block changes, which is
+# checked at most every call_cache_interval seconds, and after each wait for
+# a transaction or new block. Results at a block number are kept until evicted
+call_cache = 0
+call_cache_interval = 1
+# Other nodes for read-only calls, as comma separated URLs. eth_call,
+# eth_getCode, eth_getLogs, eth_getBalance and eth_getStorageAt go to the
+# node with the lowest latency, unless they ask about the pending block.
+# A node that failed is left out for endpoint_cooldown seconds. A node more
+# than max_lag blocks behind the highest head, host:port's included, is left
+# out until it catches up. Heads are checked every head_interval seconds in
+# the background, only the first read waits for them. Reads fall back to
+# host:port when no other node is available. Transactions, nonces, receipts
+# and filters always go to host:port
+endpoints =
+max_lag = 2
+endpoint_cooldown = 30
+head_interval = 5
 
 [deploy]
 gas = 100000
 gas_price = 50000000000
 fixed_price = False
 gas_price_modifier = 1.00
+# Seconds to reuse the network gas price when fixed_price is False, or until
+# a block filter sees a new block
+gas_price_ttl = 10
 retry = 60
 skip = 90
+# When retry passes, resend transactions with the same nonce and their gas
+# price times gas_bump, up to gas_price_cap, instead of sending new ones,
+# until any of them is mined (0 to disable, nodes usually require 1.1 or more)
+gas_bump = 0
+gas_price_cap = 500000000000
+# Assign nonces locally instead of waiting for each transaction to reach the pool
+local_nonces = False
+# With local_nonces, use the address of contracts deployed without retry or wait
+# as soon as they're sent, derived from the sender and nonce, and confirm them
+# once the whole package is sent (only transactions from the same sender are
+# guaranteed to be mined after the contract they use)
+predict_addresses = False
+# Sign transactions with the keys in <config_dir>/keystore and send them with
+# eth_sendRawTransaction instead of having the node sign them, in
+# signing_workers processes for batches (0 for one per core), prompting for
+# the keystore password when keystore_password is empty
+local_signing = False
+keystore_password =
+signing_workers = 0
+# Number of package steps to run concurrently, steps only wait for the
+# steps defining the $variables they use (1 runs them in order)
+workers = 1
+# Record deployed contracts in <package>.lock.json and reuse the ones whose
+# code and inputs didn't change on later runs. A transact step to a reused
+# contract, with only $variables of reused contracts, is skipped when the
+# lockfile already records it with the same inputs. Other transact steps,
+# and call steps, run on every deploy
+lockfile = False
+# Maximum number of unconfirmed transactions of a batch step. Rows rejected
+# as nonce too low are sent once more after resyncing, the nonces of other
+# rejected rows go to the next rows. Transactions stuck behind a nonce no
+# row was left to use are counted as unconfirmed. With journal, --resume
+# skips the rows done and only sends again the ones the node doesn't know
+batch_window = 500
+# Journal completed steps in config_dir so a failed deploy can be
+# resumed with --resume, syncing it to disk at most every journal_sync_interval seconds
+journal = True
+journal_sync_interval = 1
+resume = False
+# Number of processes compiling contracts ahead of time (0 for one per core)
+compile_workers = 0
 
 [misc]
 config_dir = {0}
 verbosity = 1
+# Size in MB of the on-disk cache of confirmed blocks, transactions, receipts
+# and contract code in config_dir (0 to disable), and the number of blocks
+# after which data is considered confirmed. Data from newer blocks is always
+# fetched again, and cached data a fetch no longer matches, like after a
+# reorg, is dropped
+chain_cache_size = 0
+chain_cache_confirmations = 12
+# Number of compiled contracts to keep in config_dir, keyed by a hash of their
+# sources, includes and compiler version (0 to always compile)
+compile_cache_size = 256
+# Keep the parsed plan of each package in config_dir until the package
+# changes, for at most plan_cache_size packages
+plan_cache = True
+plan_cache_size = 64
 
 # :INFO, :WARN, :DEBUG, pyepm.deploy:DEBUG ...
 logging = :INFO
@@ -11,10 +11,23 @@ import os
 import api
 import json
 import yaml
-import subprocess
+import hashlib
+import cPickle as pickle
+import threading
+from concurrent import futures
+from batch import BatchSender, read_rows
 from colors import colors
-from distutils import spawn
-from serpent import compile
+from compiler import Compiler
+from journal import Journal
+from lockfile import Lockfile
+from placeholders import Placeholders
+from plan import PLAN_VERSION, compile_plan
+from utils import config_dir
+
+try:
+    from yaml import CLoader as Loader
+except ImportError:
+    from yaml import Loader
 
 logger = logging.getLogger(__name__)
 
@@ -22,162 +35,324 @@ class Deploy(object):
     def __init__(self, filename, config):
         self.filename = filename
         self.config = config
+        self.lock = threading.RLock()
+        self.compiler = Compiler(config)
+        self.lockfile = None
+        self.journal = None
+        self.placeholders = None
+        self.plan = None
+        self.tx_hashes = {}
+        self.predicted = {}
+        self.creations = None
+        self.batches = {}
+        self.locked = set()
+        self.targets = {}
 
     def deploy(self, wait=False):
-        default_from = self.config.get('api', 'address')
-        default_gas = int(self.config.getint('deploy', 'gas'))
-        default_gas_price = int(self.config.getint('deploy', 'gas_price'))
-
         # Load YAML definitions
-        definitions = self.load_yaml()
+        self.definitions, plan = self.load_plan()
 
         logger.debug("\nParsing %s..." % self.filename)
-        path = os.path.dirname(self.filename)
-
-        for definition in definitions:
-            for key in definition:
-                logger.info(colors.HEADER + "\n%s: " % key + colors.ENDC)
-
-                if key == 'set':
-                    for variable in definition[key]:
-                        replacement = definition[key][variable]
-                        definitions = self.replace(variable, definitions, replacement)
-                    logger.debug(definitions)
-
-                if key == 'deploy':
-                    for name in definition[key]:
-                        # Reset default values at each definition
-                        contract_names = []
-                        from_ = default_from
-                        gas = default_gas
-                        gas_price = default_gas_price
-                        value = 0
-                        retry = False
-                        skip = False
-                        wait = False
-                        for option in definition[key][name]:
-                            if option == 'contract':
-                                contract = definition[key][name][option]
-                            if option == 'solidity':
-                                contract_names = definition[key][name][option]
-                            if option == 'from':
-                                from_ = definition[key][name][option]
-                            if option == 'gas':
-                                gas = int(definition[key][name][option])
-                            if option == 'gas_price':
-                                gas_price = int(definition[key][name][option])
-                            if option == 'value':
-                                value = int(definition[key][name][option])
-                            if option == 'endowment':
-                                value = int(definition[key][name][option])
-                            if option == 'wait':
-                                wait = definition[key][name][option]
-                            if option == 'skip':
-                                skip = int(definition[key][name][option])
-                            if option == 'retry':
-                                retry = int(definition[key][name][option])
-                        logger.info("  Deploying " + colors.BOLD + "%s" % os.path.join(path, contract) + colors.ENDC + "...")
-                        addresses = self.create("%s" % os.path.join(path, contract),
-                                                from_, gas, gas_price, value,
-                                                retry, skip, wait,
-                                                contract_names=contract_names if contract_names else name)
-                        if isinstance(addresses, list):
-                            for address in addresses:
-                                definitions = self.replace(name, definitions, address, True)
-                        else:
-                            definitions = self.replace(name, definitions, addresses, True)
-                    logger.debug(definitions)
-
-                if key in ['transact', 'call']:
-                    for name in definition[key]:
-                        # Reset default values at each definition
-                        from_ = default_from
-                        to = None
-                        sig = None
-                        data = ''
-                        gas = default_gas
-                        gas_price = default_gas_price
-                        value = 0
-                        retry = False
-                        skip = False
-                        wait = False
-                        for option in definition[key][name]:
-                            if option == 'from':
-                                from_ = definition[key][name][option]
-                            if option == 'to':
-                                to = definition[key][name][option]
-                            if option == 'fun_name':
-                                raise DeprecationWarning("The `fun_name` definition is deprecated, use `serpent mk_signature <file>`"
-                                                         " output for your method in `sig` instead.")
-                            if option == 'sig':
-                                sig = definition[key][name][option]
-                            if option == 'data':
-                                dat = definition[key][name][option]
-                                if isinstance(dat, list):
-                                    for i, d in enumerate(dat):
-                                        if isinstance(d, (basestring)) and not d.startswith("0x") and not d.startswith("$"):
-                                            if d != d.decode('string_escape'):
-                                                definition[key][name][option][i] = d.decode('string_escape')
-                                            else:
-                                                padded = "0x" + d.encode('hex')
-                                                definition[key][name][option][i] = u"%s" % padded
-                                                logger.info("  Converting " + colors.BOLD + "'%s'" % d.encode('unicode-escape') + colors.ENDC +
-                                                            " string to " + colors.BOLD + "%s" % padded + colors.ENDC)
-                                data = definition[key][name][option]
-                            if option == 'gas':
-                                gas = int(definition[key][name][option])
-                            if option == 'gas_price':
-                                gas_price = int(definition[key][name][option])
-                            if option == 'value':
-                                value = int(definition[key][name][option])
-                            if option == 'retry':
-                                retry = int(definition[key][name][option])
-                            if option == 'skip':
-                                skip = int(definition[key][name][option])
-                            if option == 'wait':
-                                wait = definition[key][name][option]
-                        logger.info("  %s " % ("Transaction" if key == 'transact' else "Call") +
-                                    colors.BOLD + "%s" % name + colors.ENDC + " to " +
-                                    colors.BOLD + "%s " % to + colors.ENDC + "...")
-                        if data:
-                            bluedata = []
-                            for dat in data:
-                                bluedata.append(colors.OKBLUE + "%s" % dat + colors.ENDC)
-                            logger.info("      with data: [" + ", ".join(bluedata) + "]")
-                        if key == 'transact':
-                            self.transact(to, from_, sig, data, gas, gas_price, value, retry, skip, wait)
-                        elif key == 'call':
-                            self.call(to, from_, sig, data, gas, gas_price, value)
+        self.path = os.path.dirname(self.filename)
+
+        if self.config.getboolean('deploy', 'lockfile'):
+            self.lockfile = Lockfile(Lockfile.path_for(self.filename))
+            self.lockfile.verify(api.Api(self.config))
+
+        # Steps are substituted as they run, keep the compiled plan as is
+        self.plan = [step.copy() for step in plan]
+        self.placeholders = Placeholders(self.plan)
+        self.targets = dict(((step.index, step.key, step.name), (step.to, step.variables()))
+                            for step in self.plan if step.key == 'transact')
+        steps = self.plan
+
+        if self.config.getboolean('deploy', 'journal'):
+            self.journal = Journal(Journal.path_for(self.filename), self.config.getfloat('deploy', 'journal_sync_interval'))
+            steps = self.resume(steps, self.journal.open(self.config.getboolean('deploy', 'resume')))
+
+        # Compile every contract in the background, steps before the first
+        # transaction run meanwhile, and compile errors are raised before it
+        first = len(steps)
+        for i, step in enumerate(steps):
+            if step.key in ['deploy', 'transact', 'batch']:
+                first = i
+                break
+        completed = False
+        try:
+            self.compiler.start(self.compile_jobs(steps))
+            for step in steps[:first]:
+                self.run_step(step)
+            self.compiler.wait()
+
+            workers = self.config.getint('deploy', 'workers')
+            if workers > 1:
+                self.schedule(steps[first:], workers)
+            else:
+                for step in steps[first:]:
+                    self.run_step(step)
+            self.confirm_creations()
+            completed = True
+        finally:
+            if self.lockfile is not None:
+                self.lockfile.save()
+            if self.journal is not None:
+                self.journal.close(remove=completed)
 
         logger.info("\n" + colors.OKGREEN + "Done!" + colors.ENDC + "\n")
+        instance = api.Api(self.config)
+        logger.debug("RPC transport: %s" % instance.transport.stats())
+        if instance.readers is not None:
+            logger.debug("RPC endpoints: %s" % instance.readers.stats())
+        logger.debug("Gas price cache: %s" % instance.gas_prices.stats())
+        if instance.call_cache is not None:
+            logger.debug("Call cache: %s" % instance.call_cache.stats())
+        if instance.chain_cache is not None:
+            logger.debug("Chain cache: %s" % instance.chain_cache.stats())
+        if self.compiler.cache is not None:
+            logger.debug("Compile cache: %s" % self.compiler.stats())
+
+    # Compiles the package definitions into a plan of plan.Step
+    def steps(self, definitions):
+        return compile_plan(definitions,
+                            self.config.get('api', 'address'),
+                            self.config.getint('deploy', 'gas'),
+                            self.config.getint('deploy', 'gas_price'),
+                            self.config.getint('deploy', 'batch_window'))
+
+    # Restores the variables of the steps completed by a previous run, returns the steps left
+    def resume(self, steps, records):
+        done = set()
+        for record in records:
+            index, key, name = record['step']
+            if 'batch' in record:
+                # Progress of a batch step that may not be complete
+                self.batches.setdefault((index, key, name), []).append(record['batch'])
+                continue
+            for variable, replacement, isContract in record.get('replace', []):
+                self.plan = self.replace(variable, self.plan, replacement, isContract)
+            done.add((index, key, name))
+        if done:
+            logger.info("  Resuming, skipping %d completed steps" % len(done))
+        return [step for step in steps if (step.index, step.key, step.name) not in done]
+
+    # Contracts of the deploy steps as (kind, path, contract names)
+    def compile_jobs(self, steps):
+        jobs = []
+        for step in steps:
+            if step.key != 'deploy' or not isinstance(step.contract, basestring) or step.contract.startswith('$'):
+                continue
+            path = os.path.join(self.path, step.contract)
+            if step.contract[-3:] == 'sol' or isinstance(step.contract_names, list):
+                if isinstance(step.contract_names, list) and step.contract_names:
+                    jobs.append(('solidity', path, step.contract_names))
+            else:
+                jobs.append(('serpent', path, None))
+        return jobs
+
+    # A step depends on the steps defining its $variables and the last one to the same contract
+    def dependencies(self, steps):
+        producers = {}
+        targets = {}
+        dependencies = []
+        for i, step in enumerate(steps):
+            depends = set()
+            if step.key == 'set':
+                for variable, _ in step.values:
+                    producers[variable] = i
+            else:
+                for variable in step.variables():
+                    if variable in producers:
+                        depends.add(producers[variable])
+                if step.key == 'deploy':
+                    producers[step.name] = i
+                else:
+                    if step.to in targets:
+                        depends.add(targets[step.to])
+                    targets[step.to] = i
+            dependencies.append(depends)
+        return dependencies
+
+    def schedule(self, steps, workers):
+        dependencies = self.dependencies(steps)
+        pending = set(range(len(steps)))
+        done = set()
+        running = {}
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                while pending or running:
+                    for i in sorted(pending):
+                        if dependencies[i] <= done:
+                            pending.remove(i)
+                            running[executor.submit(self.run_step, steps[i])] = i
+                    finished, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                    for future in finished:
+                        future.result()
+                        done.add(running.pop(future))
+            except Exception:
+                for future in running:
+                    future.cancel()
+                raise
+
+    def run_step(self, step):
+        if step.first:
+            logger.info(colors.HEADER + "\n%s: " % step.key + colors.ENDC)
+
+        record = {'step': [step.index, step.key, step.name]}
+        with self.lock:
+            step.resolve()
+        if step.key == 'set':
+            record['replace'] = []
+            with self.lock:
+                for variable, replacement in step.values:
+                    self.plan = self.replace(variable, self.plan, replacement)
+                    record['replace'].append([variable, replacement, False])
+            logger.debug(self.plan)
+
+        if step.key == 'deploy':
+            addresses = self.deploy_step(step)
+            record['replace'] = [[step.name, address, True] for address in (addresses if isinstance(addresses, list) else [addresses])]
+            logger.debug(self.plan)
+
+        if step.key in ['transact', 'call']:
+            record['result'] = self.transaction_step(step)
+
+        if step.key == 'batch':
+            record['result'] = self.batch_step(step)
+
+        if self.journal is not None:
+            self.journal.record(record)
+
+    def deploy_step(self, step):
+        name = step.name
+        with self.lock:
+            contract = step.contract
+            from_ = step.from_
+        path = os.path.join(self.path, contract)
+        contract_names = step.contract_names if step.contract_names else name
+
+        # Reuse the contract from the lockfile when its code and inputs didn't change
+        code = None
+        inputs = {'contract': contract, 'solidity': contract_names, 'from': from_, 'value': step.value}
+        if self.lockfile is not None and (path[-3:] != 'sol' or isinstance(contract_names, list)):
+            if isinstance(contract_names, list):
+                code = self.compiler.solidity(path, contract_names)
+            else:
+                code = self.compiler.serpent(path)
+            addresses = self.lockfile.get(name, code, inputs)
+            if addresses is not None:
+                logger.info("  Reusing " + colors.BOLD + "%s" % path + colors.ENDC + ", unchanged since last deploy")
+                with self.lock:
+                    self.locked.add(name)
+                    for address in addresses:
+                        self.plan = self.replace(name, self.plan, address, True)
+                return addresses
+
+        logger.info("  Deploying " + colors.BOLD + "%s" % path + colors.ENDC + "...")
+        addresses = self.create(path, from_, step.gas, step.gas_price, step.value,
+                                step.retry, step.skip, step.wait,
+                                contract_names=contract_names)
+        if code is not None:
+            names = contract_names if isinstance(contract_names, list) else [contract_names]
+            self.lockfile.set(name, code, inputs,
+                              [self.tx_hashes.get(n) for n in names],
+                              addresses if isinstance(addresses, list) else [addresses])
+        with self.lock:
+            if code is not None:
+                self.locked.add(name)
+            if isinstance(addresses, list):
+                for address in addresses:
+                    self.plan = self.replace(name, self.plan, address, True)
+            else:
+                self.plan = self.replace(name, self.plan, addresses, True)
+        return addresses
+
+    def transaction_step(self, step):
+        with self.lock:
+            from_ = step.from_
+            to = step.to
+            sig = step.sig
+            data = list(step.data) if isinstance(step.data, list) else step.data
+        for d, padded in step.conversions:
+            logger.info("  Converting " + colors.BOLD + "'%s'" % d.encode('unicode-escape') + colors.ENDC +
+                        " string to " + colors.BOLD + "%s" % padded + colors.ENDC)
+        logger.info("  %s " % ("Transaction" if step.key == 'transact' else "Call") +
+                    colors.BOLD + "%s" % step.name + colors.ENDC + " to " +
+                    colors.BOLD + "%s " % to + colors.ENDC + "...")
+        if data:
+            bluedata = []
+            for dat in data:
+                bluedata.append(colors.OKBLUE + "%s" % dat + colors.ENDC)
+            logger.info("      with data: [" + ", ".join(bluedata) + "]")
+        if step.key == 'transact':
+            inputs = self.locked_inputs(step, to, from_, sig, data)
+            if inputs is not None:
+                tx_hash = self.lockfile.transaction(inputs)
+                if tx_hash is not None:
+                    logger.info("      Skipping, already sent to the reused contract in " + colors.BOLD + "%s" % tx_hash + colors.ENDC)
+                    return tx_hash
+            result = self.transact(to, from_, sig, data, step.gas, step.gas_price, step.value, step.retry, step.skip, step.wait)
+            if inputs is not None and result:
+                self.lockfile.set_transaction(inputs, result)
+            return result
+        elif step.key == 'call':
+            return self.call(to, from_, sig, data, step.gas, step.gas_price, step.value)
+
+    # Inputs of a transact step whose target and $variables all come from the lockfile, None otherwise
+    def locked_inputs(self, step, to, from_, sig, data):
+        if self.lockfile is None:
+            return None
+        target, variables = self.targets[(step.index, step.key, step.name)]
+        with self.lock:
+            locked = isinstance(target, basestring) and target.startswith('$') and target[1:] in self.locked
+            if not locked or not set(variables) <= self.locked:
+                return None
+        return {'to': to, 'from': from_, 'sig': sig, 'data': data, 'value': step.value}
+
+    def batch_step(self, step):
+        with self.lock:
+            from_ = step.from_
+            to = step.to
+            sig = step.sig
+            path = os.path.join(self.path, step.file)
+        logger.info("  Batch " + colors.BOLD + "%s" % step.name + colors.ENDC + " to " +
+                    colors.BOLD + "%s " % to + colors.ENDC + "from " + colors.BOLD + "%s" % path + colors.ENDC + "...")
+        key = (step.index, step.key, step.name)
+        checkpoint = None
+        if self.journal is not None:
+            def checkpoint(progress):
+                self.journal.record({'step': list(key), 'batch': progress})
+        sender = BatchSender(api.Api(self.config), window=step.window, skip=step.skip or None, checkpoint=checkpoint)
+        return sender.run(read_rows(path, step.columns), to, sig, from_,
+                          step.gas, step.gas_price, step.value, wait=step.wait, resume=self.batches.get(key))
 
     def compile_solidity(self, contract, contract_names=[]):
-        if not spawn.find_executable("solc"):
-            raise Exception("solc compiler not found")
-
-        subprocess.call(["solc", "--input-file", contract, "--binary", "file"])
-        contracts = []
-
         if not isinstance(contract_names, list):
             raise Exception("Contract names must be list")
         if not contract_names:
             contract_names = [contract[:-4]]
-        for contract_name in contract_names:
-            filename = "%s.binary" % contract_name
-            evm = "0x" + open(filename).read()
-            contracts.append((contract_name, evm))
-
-        return contracts
+        return self.compiler.solidity(contract, contract_names)
 
     def create(self, contract, from_, gas, gas_price, value, retry, skip, wait, contract_names=None):
         instance = api.Api(self.config)
         verbose = (True if self.config.get('misc', 'verbosity') > 1 else False)
 
+        # Use the address derived from the sender and nonce right away, and
+        # only confirm it once every step is sent
+        if (self.config.getboolean('deploy', 'predict_addresses') and instance.local_nonces and
+                not retry and not wait and contract[-3:] != 'sol' and not isinstance(contract_names, list)):
+            return self.create_predicted(contract, from_, gas, gas_price, value, contract_names)
+
         tx_hashes = self.try_create_deploy(contract, from_, gas, gas_price, value, retry, skip, wait, verbose, contract_names)
 
         if isinstance(tx_hashes, list):
             return tx_hashes  # actually addresses from Solidity
 
+        # Already mined, or skipped, when replacing with higher gas prices
+        if retry and instance.gas_bump:
+            address = instance.get_contract_address(tx_hashes)
+            self.log_contract(address, contract_names)
+            return address
+
         # Wait for Serpent contract in pending state
         # TODO this should be here, but they screwed up eth_getTransactionReceipt...
         # address = instance.get_contract_address(tx_hashes)
@@ -210,9 +385,39 @@ class Deploy(object):
         self.log_contract(address, contract_names)
         return address
 
+    def create_predicted(self, contract, from_, gas, gas_price, value, contract_name=None):
+        instance = api.Api(self.config)
+        code = self.compiler.serpent(contract)
+        tx_hash, address = instance.create_with_address(code, from_=from_, gas=gas, gas_price=gas_price, endowment=value)
+        with self.lock:
+            if self.creations is None:
+                self.creations = api.TransactionWaiter(instance, skip=1)
+            self.creations.add(tx_hash)
+            self.predicted[tx_hash] = (address, contract_name)
+            self.tx_hashes[contract_name] = tx_hash
+        self.log_contract(address, contract_name)
+        return address
+
+    # Checks the contracts created at predicted addresses ended up there
+    def confirm_creations(self):
+        if self.creations is None or not len(self.creations):
+            return
+        logger.info("\n  Confirming %d contracts..." % len(self.creations))
+        for tx_hash, receipt in self.creations.wait():
+            address, contract_name = self.predicted.pop(tx_hash)
+            if receipt is None:
+                logger.warn("      Contract " + colors.BOLD + "'%s'" % contract_name + colors.ENDC +
+                            " at %s not mined yet, skipping" % address)
+            elif receipt.get('contractAddress') and receipt['contractAddress'].lower() != address.lower():
+                raise Exception("Contract '%s' was created at %s instead of %s" % (contract_name, receipt['contractAddress'], address))
+            else:
+                logger.info("      Contract " + colors.BOLD + "'%s'" % contract_name + colors.ENDC +
+                            " confirmed at " + colors.WARNING + "%s" % address + colors.ENDC)
+
     def try_create_deploy(self, contract, from_, gas, gas_price, value, retry, skip, wait, verbose, contract_names):
         instance = api.Api(self.config)
         tx_hashes = []
+        bump_after = retry if instance.gas_bump else None
 
         if contract[-3:] == 'sol' or isinstance(contract_names, list):
             contracts = self.compile_solidity(contract, contract_names)
@@ -220,9 +425,12 @@ class Deploy(object):
             for contract_name, contract in contracts:
                 logger.debug("%s: %s" % (contract_name, contract))
 
-                tx_hash = self.try_create(contract, contract_name=contract_name, from_=from_, gas=gas, gas_price=gas_price, value=value)
+                tx_hash = self.try_create(contract, contract_name=contract_name, from_=from_, gas=gas, gas_price=gas_price, value=value,
+                                          bump_after=bump_after, skip=skip)
 
-                if not retry:
+                if bump_after:
+                    pass  # mined, or skipped
+                elif not retry:
                     instance.wait_for_transaction(tx_hash, defaultBlock='pending', retry=retry, skip=skip, verbose=verbose)
                     # TODO ... once it's fixed
                     # address = instance.get_contract_address(tx_hash)
@@ -237,7 +445,7 @@ class Deploy(object):
                             # address = instance.get_contract_address(tx_hash)
                             # self.log_contract(address, contract_name)
 
-                if wait:
+                if wait and not bump_after:
                     if not retry:
                         instance.wait_for_transaction(tx_hash, retry=retry, skip=skip, verbose=verbose)
                     else:
@@ -252,16 +460,20 @@ class Deploy(object):
                 self.log_contract(address, contract_name)
                 tx_hashes.append(tx_hash)
         else:
-            contract = compile(open(contract).read()).encode('hex')
-            tx_hash = self.try_create(contract, contract_name=contract_names, from_=from_, gas=gas, gas_price=gas_price, value=value)
+            contract = self.compiler.serpent(contract)
+            tx_hash = self.try_create(contract, contract_name=contract_names, from_=from_, gas=gas, gas_price=gas_price, value=value,
+                                      bump_after=bump_after, skip=skip)
 
         if tx_hashes:
             return tx_hashes
         return tx_hash
 
-    def try_create(self, contract, from_, gas, gas_price, value, contract_name=None):
+    def try_create(self, contract, from_, gas, gas_price, value, contract_name=None, bump_after=None, skip=None):
         instance = api.Api(self.config)
-        tx_hash = instance.create(contract, from_=from_, gas=gas, gas_price=gas_price, endowment=value)
+        tx_hash = instance.create(contract, from_=from_, gas=gas, gas_price=gas_price, endowment=value,
+                                  bump_after=bump_after, skip=skip)
+        with self.lock:
+            self.tx_hashes[contract_name] = tx_hash
         return tx_hash
 
     def log_contract(self, address, contract_name=None):
@@ -276,11 +488,16 @@ class Deploy(object):
         # from_count = instance.transaction_count(defaultBlock='pending')
         verbose = (True if self.config.get('misc', 'verbosity') > 1 else False)
 
+        # Resend with higher gas prices until mined instead of sending new transactions
+        if retry and instance.gas_bump:
+            return self.try_transact(to, from_, sig, data, gas, gas_price, value, bump_after=retry, skip=skip)
+
         result = self.try_transact(to, from_, sig, data, gas, gas_price, value)
 
-        # Wait for transaction in Tx pool
+        # Wait for transaction in Tx pool, unless the next nonce is already known locally
         if not retry:
-            instance.wait_for_transaction(transactionHash=result, defaultBlock='pending', retry=retry, skip=skip, verbose=verbose)
+            if not instance.local_nonces:
+                instance.wait_for_transaction(transactionHash=result, defaultBlock='pending', retry=retry, skip=skip, verbose=verbose)
         else:
             successful = False
             while not successful:
@@ -310,9 +527,12 @@ class Deploy(object):
                         if not successful:
                             result = self.try_transact(to, from_, sig, data, gas, gas_price, value)
 
-    def try_transact(self, to, from_, sig, data, gas, gas_price, value):
+        return result
+
+    def try_transact(self, to, from_, sig, data, gas, gas_price, value, bump_after=None, skip=None):
         instance = api.Api(self.config)
-        result = instance.transact(to, from_=from_, sig=sig, data=data, gas=gas, gas_price=gas_price, value=value)
+        result = instance.transact(to, from_=from_, sig=sig, data=data, gas=gas, gas_price=gas_price, value=value,
+                                   bump_after=bump_after, skip=skip)
         logger.info("      Result: " + colors.BOLD + "%s" % (result if result else "OK") + colors.ENDC)
         return result
 
@@ -325,24 +545,10 @@ class Deploy(object):
         return result
 
     def replace(self, variable, definitions, replacement, isContract=False):
-        # Replace variables
-        count = 0
-        for repdef in definitions:
-            for repkey in repdef:
-                for repname in repdef[repkey]:
-                    if repkey != 'set':
-                        for repoption in repdef[repkey][repname]:
-                            to_replace = repdef[repkey][repname][repoption]
-                            if to_replace == "$%s" % variable:
-                                logger.debug("- Replacing $%s with %s" % (variable, replacement))
-                                repdef[repkey][repname][repoption] = replacement
-                                count = count + 1
-                            if repoption == 'data':
-                                for i, repdata in enumerate(to_replace):
-                                    if repdata == "$%s" % variable:
-                                        logger.debug("- Replacing $%s with %s" % (variable, replacement))
-                                        repdef[repkey][repname][repoption][i] = replacement
-                                        count = count + 1
+        # Replace variables, indexing the placeholders of new definitions once
+        if self.placeholders is None or self.placeholders.definitions is not definitions:
+            self.placeholders = Placeholders(definitions)
+        count = self.placeholders.replace(variable, replacement)
         if count:
             logger.info("  %sReplacing $%s with " % (("      " if isContract else ""), variable) +
                         colors.BOLD + "%s" % replacement + colors.ENDC + " (%s)" % count)
@@ -352,8 +558,54 @@ class Deploy(object):
     def load_yaml(self):
         logger.debug("\nLoading %s..." % self.filename)
         f = open(self.filename)
-        data = yaml.load(f)
+        data = yaml.load(f, Loader=Loader)
         f.close()
-        logger.debug(json.dumps(data, indent=4))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(data, indent=4))
 
         return data
+
+    # Definitions and plan are cached in config_dir, see plan_cache
+    def load_plan(self):
+        if not self.config.getboolean('misc', 'plan_cache'):
+            definitions = self.load_yaml()
+            return definitions, self.steps(definitions)
+
+        path = os.path.abspath(self.filename)
+        stat = os.stat(path)
+        key = [PLAN_VERSION, path, stat.st_mtime, stat.st_size,
+               self.config.get('api', 'address'), self.config.getint('deploy', 'gas'), self.config.getint('deploy', 'gas_price'),
+               self.config.getint('deploy', 'batch_window')]
+        cache_dir = os.path.join(config_dir.path, 'plans')
+        cache_path = os.path.join(cache_dir, "%s.pickle" % hashlib.sha256(path).hexdigest())
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached['key'] == key:
+                logger.debug("\nUsing cached plan of %s" % self.filename)
+                os.utime(cache_path, None)
+                return cached['definitions'], cached['steps']
+        except (IOError, EOFError, KeyError, ValueError, pickle.UnpicklingError, AttributeError, ImportError):
+            pass
+
+        definitions = self.load_yaml()
+        steps = self.steps(definitions)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        tmp = "%s.%s.tmp" % (cache_path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump({'key': key, 'definitions': definitions, 'steps': steps}, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, cache_path)
+        self.evict_plans(cache_dir, self.config.getint('misc', 'plan_cache_size'))
+        return definitions, steps
+
+    def evict_plans(self, cache_dir, size):
+        plans = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith('.pickle')]
+        if len(plans) <= size:
+            return
+        plans.sort(key=lambda f: os.path.getmtime(f))
+        for filename in plans[:len(plans) - size]:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
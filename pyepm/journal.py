@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from utils import config_dir
+
+logger = logging.getLogger(__name__)
+
+def _encodable(value):
+    """Hex encodes the byte strings of `value` that aren't text, like `bytes32` call results"""
+    if isinstance(value, str):
+        try:
+            value.decode('utf-8')
+        except UnicodeDecodeError:
+            return '0x' + value.encode('hex')
+        return value
+    if isinstance(value, list):
+        return [_encodable(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, _encodable(v)) for k, v in value.items())
+    return value
+
+class Journal(object):
+    """Append-only record of the completed steps of a package, one JSON line each
+
+    Every record is flushed to the OS as soon as its step is done, so it
+    survives the process crashing. It's only fsynced every `sync_interval`
+    seconds and on `close()`, so a deploy doesn't wait on the disk after each
+    step. The file is created with the first record.
+    """
+
+    def __init__(self, path, sync_interval=1):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.synced = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path_for(filename):
+        """Journal of the package `filename`, in config_dir so packages can be read-only"""
+        path = os.path.abspath(filename)
+        return os.path.join(config_dir.path, 'journals', "%s.journal" % hashlib.sha256(path).hexdigest())
+
+    def load(self):
+        """Returns the records of a previous run, ignoring a partly written last line"""
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logger.warn("Ignoring incomplete journal entry in %s" % self.path)
+                    break
+        return records
+
+    def open(self, resume=False):
+        """Starts recording, returning the records of a previous run when resuming"""
+        records = self.load() if resume else []
+        with self._lock:
+            if records:
+                # Rewrite the previous records without any partly written line
+                tmp = "%s.tmp" % self.path
+                with open(tmp, 'w') as f:
+                    for entry in records:
+                        f.write(json.dumps(entry) + "\n")
+                os.rename(tmp, self.path)
+            elif os.path.exists(self.path):
+                os.remove(self.path)
+        return records
+
+    def record(self, entry):
+        with self._lock:
+            if self._file is None:
+                if not os.path.exists(os.path.dirname(self.path)):
+                    os.makedirs(os.path.dirname(self.path))
+                self._file = open(self.path, 'a')
+            self._file.write(json.dumps(_encodable(entry)) + "\n")
+            self._file.flush()
+            if time.time() - self.synced >= self.sync_interval:
+                os.fsync(self._file.fileno())
+                self.synced = time.time()
+
+    def close(self, remove=False):
+        """Syncs the journal, removing it once the whole package is deployed"""
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+            if remove and os.path.exists(self.path):
+                os.remove(self.path)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from api import ApiException
+
+logger = logging.getLogger(__name__)
+
+def code_hash(code):
+    return hashlib.sha256(json.dumps(code, sort_keys=True)).hexdigest()
+
+class Lockfile(object):
+    """Deployment state of a package, kept next to it in `<package>.lock.json`
+
+    Records, for each deployed name, the hash of the compiled code, the
+    inputs it was deployed with, its transaction hashes and addresses.
+    A contract is reused when its code and inputs are unchanged and its
+    addresses still hold the code first seen there. Transactions sent to
+    recorded contracts are kept by their inputs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.contracts = {}
+        self.transactions = {}
+        self.verified = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.contracts = state.get('contracts', {})
+            self.transactions = state.get('transactions', {})
+
+    @staticmethod
+    def path_for(filename):
+        return "%s.lock.json" % os.path.splitext(filename)[0]
+
+    def verify(self, api):
+        """Checks the code at every recorded address with a single `eth_getCode` batch"""
+        names = sorted(self.contracts)
+        addresses = [(name, address) for name in names for address in self.contracts[name]['addresses']]
+        if not addresses:
+            return self.verified
+        batch = api.batch(max_size=len(addresses))
+        for _, address in addresses:
+            batch.rpc('eth_getCode', [address, 'latest'])
+        batch.execute()
+
+        failed = set()
+        for (name, address), code in zip(addresses, batch.results):
+            if isinstance(code, ApiException) or not code or code in ("0x", "0x0"):
+                failed.add(name)
+                continue
+            runtime = self.contracts[name].setdefault('runtime_hashes', {})
+            digest = hashlib.sha256(code).hexdigest()
+            if runtime.setdefault(address, digest) != digest:
+                failed.add(name)
+        self.verified = set(names) - failed
+        for name in sorted(failed):
+            logger.info("  Code of %s changed or is missing on chain, will redeploy" % name)
+        return self.verified
+
+    def get(self, name, code, inputs):
+        """Returns the addresses of `name` if it can be reused with `code` and `inputs`, None otherwise"""
+        entry = self.contracts.get(name)
+        if entry is None or name not in self.verified:
+            return None
+        if entry['code_hash'] != code_hash(code) or entry['inputs'] != inputs:
+            return None
+        return entry['addresses']
+
+    def set(self, name, code, inputs, tx_hashes, addresses):
+        with self._lock:
+            self.contracts[name] = {
+                'code_hash': code_hash(code),
+                'inputs': inputs,
+                'tx_hashes': tx_hashes,
+                'addresses': addresses
+            }
+            self.verified.discard(name)
+
+    def transaction(self, inputs):
+        """Returns the hash of the transaction sent with `inputs`, None if there's none"""
+        with self._lock:
+            entry = self.transactions.get(code_hash(inputs))
+        return entry['tx_hash'] if entry is not None else None
+
+    def set_transaction(self, inputs, tx_hash):
+        with self._lock:
+            self.transactions[code_hash(inputs)] = {'inputs': inputs, 'tx_hash': tx_hash}
+
+    def save(self):
+        with self._lock:
+            # Transactions to contracts that were redeployed won't be sent again
+            addresses = set(address for entry in self.contracts.values() for address in entry['addresses'])
+            transactions = dict((key, entry) for key, entry in self.transactions.items()
+                                if entry['inputs']['to'] in addresses)
+            tmp = "%s.tmp" % self.path
+            with open(tmp, 'w') as f:
+                json.dump({'contracts': self.contracts, 'transactions': transactions}, f, indent=2, sort_keys=True)
+            os.rename(tmp, self.path)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class NonceManager(object):
+    """Hands out transaction nonces for one account locally
+
+    Seeds once from the account's pending transaction count, then assigns
+    nonces without asking the node, so transactions can be sent back to back.
+    Nonces of sends the node rejected are handed out again first to fill the
+    gap, and a "nonce too low" error resyncs from the node. After an error
+    that leaves it unknown whether the node got the transaction, like a read
+    timeout, the next nonce is synced from the node again instead.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, api, address):
+        self.api = api
+        self.address = address
+        self._next = None
+        self._released = []
+        self._lock = threading.RLock()
+
+    @classmethod
+    def shared(cls, api, address):
+        """Return the process-wide nonce manager for `address` on `api`'s node"""
+        key = (api.jsonrpc_url, address.lower())
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(api, address)
+            return cls._shared[key]
+
+    def sync(self):
+        with self._lock:
+            count = self.api.transaction_count(self.address, defaultBlock='pending')
+            if count is None:
+                raise ValueError("Could not get transaction count for %s" % self.address)
+            if self._next is not None and count < self._next:
+                logger.info("Nonce gap for %s, resuming at %d instead of %d" % (self.address, count, self._next))
+            self._next = count
+            self._released = []
+            logger.debug("Synced nonce for %s at %d" % (self.address, count))
+
+    def next(self):
+        with self._lock:
+            if self._next is None:
+                self.sync()
+            if self._released:
+                return heapq.heappop(self._released)
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def release(self, nonce):
+        """Give back a nonce whose transaction never reached the node"""
+        with self._lock:
+            if self._next is not None and nonce < self._next and nonce not in self._released:
+                heapq.heappush(self._released, nonce)
+
+    def released(self):
+        """Nonces given back and not handed out again yet, lowest first"""
+        with self._lock:
+            return sorted(self._released)
+
+    def reset(self):
+        """Forget the nonces handed out, the next one is synced from the node"""
+        with self._lock:
+            self._next = None
+            self._released = []
+
+    def failed(self, nonce, error):
+        """Gives back `nonce` if `error` means the node rejected its transaction, resets otherwise"""
+        from api import ApiException  # api imports this module
+        if isinstance(error, ApiException) and not 500 <= error.code < 600:
+            self.release(nonce)
+        else:
+            logger.info("Sending with nonce %d for %s failed, resyncing: %s" % (nonce, self.address, error))
+            self.reset()
+
+    def send(self, send):
+        """Calls `send(nonce)` with the next nonce, resyncing once if the node rejects it as too low"""
+        nonce = self.next()
+        try:
+            return send(nonce)
+        except Exception as e:
+            if 'nonce too low' not in str(e).lower():
+                self.failed(nonce, e)
+                raise
+        logger.info("Nonce %d too low for %s, resyncing" % (nonce, self.address))
+        self.sync()
+        nonce = self.next()
+        try:
+            return send(nonce)
+        except Exception as e:
+            self.failed(nonce, e)
+            raise
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from plan import Step
+
+logger = logging.getLogger(__name__)
+
+class Placeholders(object):
+    """Index of the `$variable` placeholders in a package's definitions or plan
+
+    Definitions, or the steps of a compiled plan, are walked once, recording
+    where each placeholder is used: an option's value or an element of its
+    `data` list. Substituting a variable then only touches its own
+    occurrences, in the order they appear in the package, instead of walking
+    the whole package again.
+    """
+
+    def __init__(self, definitions):
+        self.definitions = definitions
+        self.locations = {}
+        for definition in definitions:
+            if isinstance(definition, Step):
+                self._add_options(definition, definition.fields)
+                continue
+            for key in definition:
+                if key == 'set' or not isinstance(definition[key], dict):
+                    continue
+                for name in definition[key]:
+                    options = definition[key][name]
+                    if not isinstance(options, dict):
+                        continue
+                    self._add_options(options, options)
+
+    def _add_options(self, options, fields):
+        for option in fields:
+            self._add(options[option], options, option)
+            if option == 'data' and isinstance(options[option], list):
+                for i, value in enumerate(options[option]):
+                    self._add(value, options[option], i)
+
+    def _add(self, value, container, key):
+        if isinstance(value, basestring) and value.startswith('$'):
+            self.locations.setdefault(value[1:], []).append((container, key))
+
+    def replace(self, variable, replacement):
+        """Substitutes `$variable` with `replacement` everywhere, returning the number of occurrences"""
+        locations = self.locations.pop(variable, None)
+        if not locations:
+            return 0
+        placeholder = "$%s" % variable
+        count = 0
+        for container, key in locations:
+            if container[key] != placeholder:
+                continue
+            logger.debug("- Replacing %s with %s", placeholder, replacement)
+            container[key] = replacement
+            # A replacement that's a placeholder itself is substituted later on
+            self._add(replacement, container, key)
+            count += 1
+        return count
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Version of the steps' format, bump it when steps change so plans cached
+# by an older version are compiled again
+PLAN_VERSION = 1
+
+class Step(object):
+    """A step of a deployment plan, compiled from a package definition
+
+    `index` is the position of the definition in the package, `first` is
+    True for the first step of a definition. Options that may hold a
+    `$variable` are listed in `fields` and can be read and substituted
+    like mapping items, the integer ones in `ints` are converted by
+    `resolve()` once substituted. Steps are picklable.
+    """
+
+    __slots__ = ('index', 'name', 'first')
+    key = None
+    fields = ()
+    ints = ()
+
+    def __init__(self, index, name, first, **options):
+        self.index = index
+        self.name = name
+        self.first = first
+        for slot in self._slots():
+            if slot not in ('index', 'name', 'first'):
+                setattr(self, slot, options.get(slot))
+
+    @classmethod
+    def _slots(cls):
+        slots = []
+        for klass in reversed(cls.__mro__):
+            slots.extend(getattr(klass, '__slots__', ()))
+        return slots
+
+    def __getstate__(self):
+        return dict((slot, getattr(self, slot)) for slot in self._slots())
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+    def __getitem__(self, field):
+        return getattr(self, field)
+
+    def __setitem__(self, field, value):
+        setattr(self, field, value)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.__getstate__() == other.__getstate__()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self.__getstate__())
+
+    def copy(self):
+        """Returns a copy that can be substituted without changing this step"""
+        step = object.__new__(type(self))
+        state = self.__getstate__()
+        for slot, value in state.items():
+            if isinstance(value, list):
+                state[slot] = list(value)
+        step.__setstate__(state)
+        return step
+
+    def resolve(self):
+        """Converts the integer options, to run the step once its variables are substituted"""
+        for field in self.ints:
+            value = getattr(self, field)
+            if isinstance(value, basestring):
+                if value.startswith('$'):
+                    raise Exception("%s of %s was never set" % (value, self.name))
+                setattr(self, field, int(value))
+
+    def variables(self):
+        """Names of the `$variables` used by the step's options"""
+        variables = []
+        for field in self.fields:
+            values = getattr(self, field)
+            for value in values if isinstance(values, list) and field == 'data' else [values]:
+                if isinstance(value, basestring) and value.startswith('$'):
+                    variables.append(value[1:])
+        return variables
+
+
+class SetStep(Step):
+    __slots__ = ('values',)
+    key = 'set'
+
+
+class DeployStep(Step):
+    __slots__ = ('contract', 'contract_names', 'from_', 'gas', 'gas_price', 'value', 'retry', 'skip', 'wait')
+    key = 'deploy'
+    fields = ('contract', 'from_', 'gas', 'gas_price', 'value', 'retry', 'skip', 'wait')
+    ints = ('gas', 'gas_price', 'value', 'retry', 'skip')
+
+
+class TransactStep(Step):
+    __slots__ = ('to', 'from_', 'sig', 'data', 'gas', 'gas_price', 'value', 'retry', 'skip', 'wait', 'conversions')
+    key = 'transact'
+    fields = ('to', 'from_', 'sig', 'data', 'gas', 'gas_price', 'value', 'retry', 'skip', 'wait')
+    ints = ('gas', 'gas_price', 'value', 'retry', 'skip')
+
+
+class CallStep(TransactStep):
+    __slots__ = ()
+    key = 'call'
+
+
+class BatchStep(TransactStep):
+    """Sends a transaction to `to` with `sig` for each row of a CSV or JSON lines `file`"""
+
+    __slots__ = ('file', 'columns', 'window')
+    key = 'batch'
+    fields = ('to', 'from_', 'sig', 'file', 'gas', 'gas_price', 'value', 'retry', 'skip', 'wait', 'window')
+    ints = ('gas', 'gas_price', 'value', 'retry', 'skip', 'window')
+
+
+def _int(value):
+    """Converts an option to int, unless it's a `$variable` substituted later"""
+    if isinstance(value, basestring) and value.startswith('$'):
+        return value
+    return int(value)
+
+def _deploy_step(index, name, first, options, defaults):
+    step = DeployStep(index, name, first,
+                      from_=defaults['from'], gas=defaults['gas'], gas_price=defaults['gas_price'],
+                      value=0, retry=False, skip=False, wait=False)
+    for option in options:
+        if option == 'contract':
+            step.contract = options[option]
+        if option == 'solidity':
+            step.contract_names = options[option]
+        if option == 'from':
+            step.from_ = options[option]
+        if option == 'gas':
+            step.gas = _int(options[option])
+        if option == 'gas_price':
+            step.gas_price = _int(options[option])
+        if option == 'value':
+            step.value = _int(options[option])
+        if option == 'endowment':
+            step.value = _int(options[option])
+        if option == 'wait':
+            step.wait = options[option]
+        if option == 'skip':
+            step.skip = _int(options[option])
+        if option == 'retry':
+            step.retry = _int(options[option])
+    if step.contract is None:
+        raise Exception("No contract to deploy for %s" % name)
+    return step
+
+def _transaction_step(cls):
+    def compile_step(index, name, first, options, defaults):
+        step = cls(index, name, first,
+                   from_=defaults['from'], data='', gas=defaults['gas'], gas_price=defaults['gas_price'],
+                   value=0, retry=False, skip=False, wait=False, conversions=[], window=defaults['window'])
+        for option in options:
+            if option == 'from':
+                step.from_ = options[option]
+            if option == 'to':
+                step.to = options[option]
+            if option == 'fun_name':
+                raise DeprecationWarning("The `fun_name` definition is deprecated, use `serpent mk_signature <file>`"
+                                         " output for your method in `sig` instead.")
+            if option == 'sig':
+                step.sig = options[option]
+            if option == 'data':
+                step.data = normalize_data(options[option], step.conversions)
+            if option == 'gas':
+                step.gas = _int(options[option])
+            if option == 'gas_price':
+                step.gas_price = _int(options[option])
+            if option == 'value':
+                step.value = _int(options[option])
+            if option == 'retry':
+                step.retry = _int(options[option])
+            if option == 'skip':
+                step.skip = _int(options[option])
+            if option == 'wait':
+                step.wait = options[option]
+            if cls is BatchStep:
+                if option == 'file':
+                    step.file = options[option]
+                if option == 'columns':
+                    step.columns = list(options[option])
+                if option == 'window':
+                    step.window = _int(options[option])
+        if cls is BatchStep and (step.file is None or step.to is None or step.sig is None):
+            raise Exception("A batch needs a file, to and sig for %s" % name)
+        return step
+    return compile_step
+
+def normalize_data(data, conversions):
+    """Unescapes strings in `data`, or converts them to hex, recording the hex conversions"""
+    if not isinstance(data, list):
+        return data
+    data = list(data)
+    for i, d in enumerate(data):
+        if isinstance(d, (basestring)) and not d.startswith("0x") and not d.startswith("$"):
+            if d != d.decode('string_escape'):
+                data[i] = d.decode('string_escape')
+            else:
+                padded = "0x" + d.encode('hex')
+                data[i] = u"%s" % padded
+                conversions.append([d, padded])
+    return data
+
+_compilers = {
+    'deploy': _deploy_step,
+    'transact': _transaction_step(TransactStep),
+    'call': _transaction_step(CallStep),
+    'batch': _transaction_step(BatchStep)
+}
+
+def compile_plan(definitions, default_from, default_gas, default_gas_price, default_window=500):
+    """Compiles package definitions from `load_yaml` into a list of steps
+
+    A `set` is a single step, each contract of a `deploy` and each
+    `transact`, `call` or `batch` is a step of its own. Options are validated, data
+    is normalized and defaults are resolved once, here.
+    """
+    defaults = {'from': default_from, 'gas': int(default_gas), 'gas_price': int(default_gas_price),
+                'window': int(default_window)}
+    steps = []
+    for index, definition in enumerate(definitions):
+        for key in definition:
+            if key == 'set':
+                values = definition[key]
+                steps.append(SetStep(index, None, True, values=[[variable, values[variable]] for variable in values]))
+            elif key in _compilers:
+                for i, name in enumerate(definition[key]):
+                    steps.append(_compilers[key](index, name, i == 0, definition[key][name], defaults))
+    return steps
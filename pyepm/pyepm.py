@@ -34,6 +34,18 @@ def parse_arguments(parser):
         "-g", "--gas",
         dest="gas",
         help="Set the default amount of gas for deployment.")
+    parser.add_argument(
+        "-l", "--lockfile",
+        dest="lockfile",
+        action="store_const",
+        const="True",
+        help="Record deployed contracts in <package>.lock.json and reuse unchanged ones.")
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_const",
+        const="True",
+        help="Resume a failed deploy, skipping the steps it completed.")
     parser.add_argument(
         "-c", "--config",
         dest="config",
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import getpass
+import json
+import logging
+import multiprocessing
+import os
+import threading
+
+import rlp
+from concurrent import futures
+from ethereum import keys, transactions
+
+from utils import config_dir
+
+logger = logging.getLogger(__name__)
+
+def _bytes(value):
+    if not value:
+        return ''
+    if value.startswith('0x'):
+        value = value[2:]
+    return value.decode('hex')
+
+def sign_transaction(key, params):
+    """Signs the `eth_sendTransaction` parameters `params` with `key`, returns the raw transaction in hex"""
+    tx = transactions.Transaction(int(params['nonce'], 16),
+                                  int(params['gasPrice'], 16),
+                                  int(params['gas'], 16),
+                                  _bytes(params.get('to')),
+                                  int(params['value'], 16),
+                                  _bytes(params.get('data')))
+    return '0x' + rlp.encode(tx.sign(key)).encode('hex')
+
+def _sign_all(jobs):
+    return [sign_transaction(key, params) for key, params in jobs]
+
+
+class Keystore(object):
+    """Encrypted private keys, one keystore JSON file per account in `path`
+
+    Keys are decrypted the first time they're needed with `password`, or a
+    password prompted for, and kept in memory.
+    """
+
+    def __init__(self, path, password=None):
+        self.path = path
+        self.password = password or None
+        self.keys = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, password):
+        """Stores `key` encrypted with `password`, returns its address"""
+        address = '0x' + keys.privtoaddr(key).encode('hex')
+        keystore = keys.make_keystore_json(key, password)
+        keystore['address'] = address[2:]
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        with open(os.path.join(self.path, address[2:] + '.json'), 'w') as f:
+            json.dump(keystore, f)
+        return address
+
+    def key(self, address):
+        """Returns the private key of `address`"""
+        address = address.lower()
+        if address.startswith('0x'):
+            address = address[2:]
+        with self._lock:
+            if address not in self.keys:
+                self.keys[address] = self._decrypt(address)
+            return self.keys[address]
+
+    def _decrypt(self, address):
+        keystore = None
+        if os.path.isdir(self.path):
+            for filename in sorted(os.listdir(self.path)):
+                with open(os.path.join(self.path, filename)) as f:
+                    data = json.load(f)
+                if data.get('address', '').lower() == address:
+                    keystore = data
+                    break
+        if keystore is None:
+            raise Exception("No key for 0x%s in %s" % (address, self.path))
+        password = self.password
+        if password is None:
+            password = getpass.getpass("Password for 0x%s: " % address)
+        logger.debug("Decrypting key for 0x%s" % address)
+        try:
+            return keys.decode_keystore_json(keystore, password)
+        except Exception:
+            raise Exception("Wrong password for 0x%s" % address)
+
+
+class LocalSigner(object):
+    """Signs transactions with keys from a `Keystore` instead of the node
+
+    Several transactions are signed at once in `workers` processes, a single
+    one is signed right away.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, keystore, workers=0):
+        self.keystore = keystore
+        self.workers = workers or multiprocessing.cpu_count()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, config):
+        """Return the process-wide signer for the keystore in config_dir"""
+        path = os.path.join(config_dir.path, 'keystore')
+        with cls._shared_lock:
+            if path not in cls._shared:
+                cls._shared[path] = cls(Keystore(path, config.get('deploy', 'keystore_password')),
+                                        config.getint('deploy', 'signing_workers'))
+            return cls._shared[path]
+
+    def sign(self, params):
+        return sign_transaction(self.keystore.key(params['from']), params)
+
+    def sign_all(self, transactions):
+        """Signs a list of `eth_sendTransaction` parameters, returns their raw transactions in order"""
+        if len(transactions) < 2 or self.workers < 2:
+            return [self.sign(params) for params in transactions]
+        jobs = [(self.keystore.key(params['from']), params) for params in transactions]
+        with self._lock:
+            if self._executor is None:
+                self._executor = futures.ProcessPoolExecutor(max_workers=self.workers)
+        size = -(-len(jobs) // self.workers)
+        chunks = [self._executor.submit(_sign_all, jobs[i:i + size]) for i in range(0, len(jobs), size)]
+        return [raw for chunk in chunks for raw in chunk.result()]
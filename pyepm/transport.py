@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import requests
+import threading
+import time
+from concurrent import futures
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Calls any node in sync can answer, unless asked about the pending block
+READ_METHODS = frozenset(['eth_call', 'eth_getCode', 'eth_getLogs', 'eth_getBalance', 'eth_getStorageAt'])
+
+def is_read(payload):
+    """True when every call of a JSON RPC request or batch can go to any node"""
+    payloads = payload if isinstance(payload, list) else [payload]
+    return bool(payloads) and all(p['method'] in READ_METHODS and 'pending' not in (p.get('params') or [])
+                                  for p in payloads)
+
+class HttpTransport(object):
+    """Pooled keep-alive HTTP transport for JSON RPC requests, one `requests.Session` per node"""
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, url, pool_size=10, keep_alive=True, connect_timeout=None, read_timeout=None):
+        self.url = url
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout or None, read_timeout or None)
+
+        self.session = requests.Session()
+        self.session.headers.update({'content-type': 'application/json'})
+        if not keep_alive:
+            self.session.headers.update({'connection': 'close'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.adapter = adapter
+
+        self.requests = 0
+
+    @classmethod
+    def from_config(cls, url, config):
+        return cls(url,
+                   pool_size=config.getint('api', 'pool_size'),
+                   keep_alive=config.getboolean('api', 'keep_alive'),
+                   connect_timeout=config.getfloat('api', 'connect_timeout'),
+                   read_timeout=config.getfloat('api', 'read_timeout'))
+
+    @classmethod
+    def shared(cls, url, config):
+        """Return the process-wide transport for `url` and these pool settings"""
+        key = (url,
+               config.getint('api', 'pool_size'),
+               config.getboolean('api', 'keep_alive'),
+               config.getfloat('api', 'connect_timeout'),
+               config.getfloat('api', 'read_timeout'))
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls.from_config(url, config)
+            return cls._shared[key]
+
+    def post(self, data):
+        self.requests += 1
+        return self.session.post(self.url, data=data, timeout=self.timeout)
+
+    def stats(self):
+        connections = 0
+        pool_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            pool_requests += pool.num_requests
+        return {
+            'requests': self.requests,
+            'connections': connections,
+            'reused': max(pool_requests - connections, 0)
+        }
+
+    def close(self):
+        self.session.close()
+
+
+class Endpoint(object):
+    """A node of an `EndpointPool`, with its latency and head block as last seen"""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.url = transport.url
+        self.latency = None
+        self.head = None
+        self.down_until = 0
+        self.started = []
+        self.probe = None
+
+    def score(self, now):
+        """Average latency, or how long the oldest request in flight has taken if that's longer"""
+        latency = self.latency or 0
+        if self.started:
+            latency = max(latency, now - min(self.started))
+        return latency
+
+
+class EndpointPool(object):
+    """Routes read-only JSON RPC requests to the fastest node in sync, failing over to the next one"""
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, transports, signer=None, max_lag=2, cooldown=30, head_interval=5, probe_timeout=1,
+                 smoothing=0.3):
+        self.endpoints = [Endpoint(transport) for transport in transports]
+        self.signer = Endpoint(signer) if signer is not None else None
+        self.max_lag = max_lag
+        self.cooldown = cooldown
+        self.head_interval = head_interval
+        self.probe_timeout = probe_timeout
+        self.smoothing = smoothing
+        self.probed = 0
+        self.requests = 0
+        self.failovers = 0
+        self._executor = futures.ThreadPoolExecutor(max_workers=len(self.endpoints) + 1)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, urls, config, signer=None):
+        """Return the process-wide pool for `urls`, the `signer` transport and these settings"""
+        key = (tuple(urls),
+               signer.url if signer is not None else None,
+               config.getint('api', 'max_lag'),
+               config.getfloat('api', 'endpoint_cooldown'),
+               config.getfloat('api', 'head_interval'))
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls([HttpTransport.shared(url, config) for url in urls], signer,
+                                       max_lag=key[2], cooldown=key[3], head_interval=key[4])
+            return cls._shared[key]
+
+    def post(self, data):
+        """Posts to the best available node, returns None when none is"""
+        self._refresh_heads()
+        for endpoint in self.ranked():
+            start = self._started(endpoint)
+            try:
+                r = endpoint.transport.post(data)
+            except requests.RequestException as e:
+                self._failed(endpoint, start, e)
+                continue
+            if r.status_code >= 500:
+                self._failed(endpoint, start, "HTTP %s" % r.status_code)
+                continue
+            self._answered(endpoint, start)
+            with self._lock:
+                self.requests += 1
+            return r
+        return None
+
+    def ranked(self):
+        """Available nodes, fastest first"""
+        now = time.time()
+        with self._lock:
+            heads = [endpoint.head for endpoint in self._probed() if endpoint.head is not None]
+            head = max(heads) if heads else None
+            available = [endpoint for endpoint in self.endpoints
+                         if endpoint.down_until <= now and
+                         (head is None or endpoint.head is None or head - endpoint.head <= self.max_lag)]
+            return sorted(available, key=lambda endpoint: endpoint.score(now))
+
+    def _probed(self):
+        if self.signer is None:
+            return self.endpoints
+        return self.endpoints + [self.signer]
+
+    def _started(self, endpoint):
+        start = time.time()
+        with self._lock:
+            endpoint.started.append(start)
+        return start
+
+    def _answered(self, endpoint, start):
+        elapsed = time.time() - start
+        with self._lock:
+            endpoint.started.remove(start)
+            if endpoint.latency is None:
+                endpoint.latency = elapsed
+            else:
+                endpoint.latency += self.smoothing * (elapsed - endpoint.latency)
+
+    def _failed(self, endpoint, start, error):
+        with self._lock:
+            endpoint.started.remove(start)
+            endpoint.down_until = time.time() + self.cooldown
+            self.failovers += 1
+        logger.info("%s failed, leaving it out for %ss: %s" % (endpoint.url, self.cooldown, error))
+
+    def _probe(self, endpoint):
+        start = self._started(endpoint)
+        try:
+            r = endpoint.transport.post(json.dumps({"jsonrpc": "2.0", "id": "head", "method": "eth_blockNumber", "params": []}))
+            head = int(r.json()['result'], 16)
+        except Exception as e:
+            if endpoint is self.signer:
+                # Requests aren't routed to it, it only sets the head to keep up with
+                with self._lock:
+                    endpoint.started.remove(start)
+                logger.debug("Couldn't get the head of %s: %s" % (endpoint.url, e))
+                return
+            self._failed(endpoint, start, e)
+            return
+        self._answered(endpoint, start)
+        with self._lock:
+            endpoint.head = head
+
+    def _refresh_heads(self):
+        now = time.time()
+        with self._lock:
+            if now - self.probed < self.head_interval:
+                return
+            first = not self.probed
+            self.probed = now
+            probes = []
+            for endpoint in self._probed():
+                # A node still busy with its last probe isn't asked again
+                if endpoint.probe is None or endpoint.probe.done():
+                    endpoint.probe = self._executor.submit(self._probe, endpoint)
+                probes.append(endpoint.probe)
+        if first:
+            futures.wait(probes, timeout=self.probe_timeout)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'failovers': self.failovers,
+                'endpoints': dict((endpoint.url, {'latency': endpoint.score(now), 'head': endpoint.head,
+                                                  'available': endpoint.down_until <= now})
+                                  for endpoint in self.endpoints)
+            }
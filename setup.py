@@ -22,6 +22,7 @@ setup(name="pyepm",
       url='https://github.com/etherex/pyepm/',
       install_requires=[
           'pyyaml',
+          'futures',
           'ethereum',
           'ethereum-serpent',
           'requests'
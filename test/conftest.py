@@ -0,0 +1,8 @@
+import pytest
+
+from pyepm.utils import config_dir
+
+@pytest.fixture(autouse=True)
+def isolated_config_dir(tmpdir_factory, monkeypatch):
+    """Keeps the caches and journals written by tests out of the real config_dir"""
+    monkeypatch.setattr(config_dir, '_path', str(tmpdir_factory.mktemp('pyepm')))
@@ -1,4 +1,5 @@
 from distutils import spawn
+import json
 import mock
 import pytest
 import requests
@@ -33,3 +34,37 @@ def mock_json_response(status_code=200, error=None, result=None):
         m.reason = 'Error Reason'
     m.json.return_value = json_response
     return m
+
+def mock_rpc_response(payload, result):
+    """JSON RPC response to `payload`, an error when `result` is a dict with a `code`"""
+    response = {u'jsonrpc': u'2.0', u'id': payload['id']}
+    if isinstance(result, dict) and 'code' in result:
+        response[u'error'] = result
+    else:
+        response[u'result'] = result
+    return response
+
+def mock_batch_post(results):
+    """side_effect for a mocked Session.post answering JSON RPC batches with `results` in order"""
+    results = list(results)
+
+    def post(url, data=None, **kwargs):
+        responses = [mock_rpc_response(payload, results.pop(0)) for payload in json.loads(data)]
+        m = mock.MagicMock(spec=requests.Response)
+        m.status_code = 200
+        m.json.return_value = list(reversed(responses))
+        return m
+    return post
+
+def mock_node(answer):
+    """side_effect for a mocked Session.post answering single and batch JSON RPC calls with `answer(payload)`"""
+    def post(url, data=None, **kwargs):
+        payload = json.loads(data)
+        m = mock.MagicMock(spec=requests.Response)
+        m.status_code = 200
+        if isinstance(payload, list):
+            m.json.return_value = [mock_rpc_response(p, answer(p)) for p in payload]
+        else:
+            m.json.return_value = mock_rpc_response(payload, answer(payload))
+        return m
+    return post
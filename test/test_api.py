@@ -1,12 +1,15 @@
+import itertools
+import json
 import pytest
+import threading
 
-from pyepm import api
+from pyepm import api, config as c, nonces
 
-from helpers import COW_ADDRESS, config, mock_json_response
+from helpers import COW_ADDRESS, config, mock_batch_post, mock_json_response, mock_node
 
 def test_api_exception_error_response(mocker):
     instance = api.Api(config)
-    mocker.patch('requests.post', return_value=mock_json_response(error={'code': 31337, 'message': 'Too Elite'}))
+    mocker.patch('requests.Session.post', return_value=mock_json_response(error={'code': 31337, 'message': 'Too Elite'}))
     with pytest.raises(api.ApiException) as excinfo:
         instance.coinbase()
     assert excinfo.value.code == 31337
@@ -14,7 +17,7 @@ def test_api_exception_error_response(mocker):
 
 def test_api_exception_status_code(mocker):
     instance = api.Api(config)
-    mocker.patch('requests.post', return_value=mock_json_response(status_code=404))
+    mocker.patch('requests.Session.post', return_value=mock_json_response(status_code=404))
     with pytest.raises(api.ApiException) as excinfo:
         instance.coinbase()
     assert excinfo.value.code == 404
@@ -24,7 +27,7 @@ def mock_rpc(mocker, rpc_fun, rpc_args, json_result, rpc_method, rpc_params):
     instance = api.Api(config)
     instance.fixed_price = True
 
-    mocker.patch('requests.post', return_value=mock_json_response(result=json_result))
+    mocker.patch('requests.Session.post', return_value=mock_json_response(result=json_result))
     mock_rpc_post = mocker.patch.object(instance, '_rpc_post', side_effect=instance._rpc_post)
 
     result = getattr(instance, rpc_fun)(*rpc_args)
@@ -184,3 +187,198 @@ def test_call_returning_array(mocker):
                    'gasPrice': hex(50000000000)}, 'latest']
     assert mock_rpc(mocker, 'call', [address, sig, data], json_result=json_result,
                     rpc_method='eth_call', rpc_params=rpc_params) == [3, 2, 1, 0]  # with length prefix of 3
+
+def test_batch(mocker):
+    instance = api.Api(config)
+    address = '0x7adf3b3bce3a5c8c17e8b243f4c331dd97c60579'
+    post = mocker.patch('requests.Session.post', side_effect=mock_batch_post([
+        '0x01495010e21ff5d000', '0x2a', {'code': -32000, 'message': 'Unknown block'}, '0xdeadbeef', '0x']))
+    with instance.batch() as batch:
+        batch.balance_at(address)
+        batch.transaction_count(address)
+        batch.storage_at(address, 1, defaultBlock='0x1')
+        batch.is_contract_at(address)
+        batch.is_contract_at(COW_ADDRESS)
+    assert post.call_count == 1
+    assert batch.results[:2] == [23729485000000000000, 42]
+    assert isinstance(batch.results[2], api.ApiException)
+    assert batch.results[2].code == -32000
+    assert batch.results[3:] == [True, False]
+
+def test_batch_split(mocker):
+    instance = api.Api(config)
+    post = mocker.patch('requests.Session.post', side_effect=mock_batch_post([hex(i) for i in range(5)]))
+    batch = instance.batch(max_size=2)
+    for i in range(5):
+        batch.balance_at('0x%040x' % i)
+    assert batch.execute() == range(5)
+    assert post.call_count == 3
+
+def test_batch_not_supported(mocker):
+    instance = api.Api(config)
+    mocker.patch('requests.Session.post', return_value=mock_json_response(error={'code': -32600, 'message': 'Invalid request'}))
+    batch = instance.batch()
+    batch.transaction('0x01')
+    with pytest.raises(api.ApiException) as excinfo:
+        batch.execute()
+    assert excinfo.value.code == -32600
+
+def test_wait_for_transaction_filter(mocker):
+    api.BlockFilter._shared.clear()
+    instance = api.Api(config)
+    instance.wait_mode = 'filter'
+    mocker.patch('time.sleep')
+    post = mocker.patch('requests.Session.post', side_effect=[
+        mock_json_response(result='0x1'),  # eth_newBlockFilter
+        mock_json_response(result={'blockNumber': None}),
+        mock_json_response(result=[]),  # no new block yet
+        mock_json_response(result=['0x806eee83f9aaa349031bd0dccd50241cc898c65cd36b8fa53aaaee3638d27488']),
+        mock_json_response(result={'blockNumber': '0x2a'})])
+    assert instance.wait_for_transaction('0xdeadbeef')
+    assert post.call_count == 5
+
+def test_wait_for_shared_filter(mocker):
+    api.BlockFilter._shared.clear()
+    first, second = api.Api(config), api.Api(config)
+    first.wait_mode = second.wait_mode = 'filter'
+    mocker.patch('time.sleep')
+    post = mocker.patch('requests.Session.post', side_effect=[
+        mock_json_response(result='0x1'),  # eth_newBlockFilter, once for both
+        mock_json_response(result={'blockNumber': None}),
+        mock_json_response(result=['0x806eee83f9aaa349031bd0dccd50241cc898c65cd36b8fa53aaaee3638d27488']),
+        mock_json_response(result={'blockNumber': '0x2a'}),
+        mock_json_response(result={'blockNumber': '0x2a'})])
+    assert first.wait_for_transaction('0x01')
+    assert second.wait_for_transaction('0x02')
+    methods = [json.loads(call[1]['data'])['method'] for call in post.call_args_list]
+    assert methods.count('eth_newBlockFilter') == 1
+
+def test_wait_for_contract_filter_fallback(mocker):
+    api.BlockFilter._shared.clear()
+    instance = api.Api(config)
+    instance.wait_mode = 'filter'
+    sleep = mocker.patch('time.sleep')
+    mocker.patch('requests.Session.post', side_effect=[
+        mock_json_response(error={'code': -32601, 'message': 'Method not found'}),
+        mock_json_response(result='0xdeadbeef')])
+    assert instance.wait_for_contract('0x6489ecbe173ac43dadb9f4f098c3e663e8438dd7')
+    assert instance.wait_mode == 'poll'
+    sleep.assert_called_once_with(1)
+
+def test_transaction_waiter(mocker):
+    instance = api.Api(config)
+    mocker.patch('time.sleep')
+    post = mocker.patch('requests.Session.post', side_effect=mock_batch_post([
+        None, {'blockNumber': '0x2a'}, None,
+        {'blockNumber': '0x2b'}]))
+    waiter = api.TransactionWaiter(instance)
+    waiter.add('0x01')
+    waiter.add('0x02')
+    waiter.add('0x03', skip=-1)
+    completed = list(waiter.wait())
+    assert completed == [('0x02', {'blockNumber': '0x2a'}), ('0x03', None), ('0x01', {'blockNumber': '0x2b'})]
+    assert post.call_count == 2
+    assert len(waiter) == 0
+
+def test_call_returning_negative_int(mocker):
+    address = '0x6489ecbe173ac43dadb9f4f098c3e663e8438dd7'
+    sig = 'multiply:[int256]:int256'
+    json_result = '0x' + 'f' * 64
+    rpc_params = [{'gas': hex(100000),
+                   'from': COW_ADDRESS,
+                   'to': address,
+                   'data': '0x1df4f144' + 'f' * 64,
+                   'value': hex(0),
+                   'gasPrice': hex(50000000000)}, 'latest']
+    assert mock_rpc(mocker, 'call', [address, sig, [-1]], json_result=json_result,
+                    rpc_method='eth_call', rpc_params=rpc_params) == [-1]
+
+def test_contract_address():
+    assert api.contract_address('0x6ac7ea33f8831ea9dcc53393aaa88b25a785dbf0', 0) == '0xcd234a471b72ba2f1ccf0a70fcaba648a5eecd8d'
+    assert api.contract_address('6ac7ea33f8831ea9dcc53393aaa88b25a785dbf0', 1) == '0x343c43a37d37dff08ae8c4a11544c718abb4fcf8'
+
+def test_send_with_bumps(mocker):
+    settings = c.get_default_config()
+    settings.set('deploy', 'fixed_price', 'True')
+    settings.set('deploy', 'gas_bump', '1.5')
+    settings.set('deploy', 'gas_price_cap', '100000000000')
+    instance = api.Api(settings)
+    nonces.NonceManager._shared.clear()
+    sent = []
+
+    def answer(payload):
+        if payload['method'] == 'eth_getTransactionCount':
+            return '0x7'
+        if payload['method'] == 'eth_sendTransaction':
+            sent.append(payload['params'][0])
+            return '0x%02x' % len(sent)
+        # Only the second replacement gets mined
+        if payload['params'][0] == '0x03':
+            return {'blockNumber': '0x2a'}
+    mocker.patch('requests.Session.post', side_effect=mock_node(answer))
+    mocker.patch('time.sleep')
+    mocker.patch('time.time', side_effect=itertools.count(0, 20))
+
+    assert instance.transact(COW_ADDRESS, bump_after=30) == '0x03'
+    assert [int(params['nonce'], 16) for params in sent] == [7, 7, 7]
+    # Raised by half each time, never above the cap
+    assert [int(params['gasPrice'], 16) for params in sent] == [50000000000, 75000000000, 100000000000]
+
+def test_send_with_bumps_node_nonces(mocker):
+    settings = c.get_default_config()
+    settings.set('deploy', 'fixed_price', 'True')
+    settings.set('deploy', 'gas_bump', '1.5')
+    instance = api.Api(settings)
+    nonces.NonceManager._shared.clear()
+    sent = []
+
+    def answer(payload):
+        if payload['method'] == 'eth_getTransactionCount':
+            return hex(7 + len(sent))
+        if payload['method'] == 'eth_sendTransaction':
+            sent.append(payload['params'][0].get('nonce'))
+            return '0x%02x' % len(sent)
+        return {'blockNumber': '0x2a'}
+    mocker.patch('requests.Session.post', side_effect=mock_node(answer))
+    mocker.patch('time.sleep')
+
+    instance.transact(COW_ADDRESS, bump_after=30)
+    instance.transact(COW_ADDRESS)
+    instance.transact(COW_ADDRESS, bump_after=30)
+    # The node assigned 8 to the plain transaction
+    assert sent == ['0x7', None, '0x9']
+
+def test_send_with_bumps_signer(mocker):
+    settings = c.get_default_config()
+    settings.set('deploy', 'fixed_price', 'True')
+    instance = api.Api(settings)
+    nonces.NonceManager._shared.clear()
+    holding, release = threading.Event(), threading.Event()
+    sent = []
+
+    class Signer(object):
+        def sign(self, params):
+            if not holding.is_set():
+                # Keep the first nonce from reaching the node until the bumped send took one
+                holding.set()
+                release.wait()
+            return params['nonce']
+    instance.signer = Signer()
+
+    def answer(payload):
+        if payload['method'] == 'eth_getTransactionCount':
+            return hex(7 + len(sent))
+        if payload['method'] == 'eth_sendRawTransaction':
+            sent.append(payload['params'][0])
+            return '0x%02x' % len(sent)
+        return {'blockNumber': '0x2a'}
+    mocker.patch('requests.Session.post', side_effect=mock_node(answer))
+    mocker.patch('time.sleep')
+
+    plain = threading.Thread(target=instance.transact, args=(COW_ADDRESS,))
+    plain.start()
+    holding.wait()
+    instance.transact(COW_ADDRESS, bump_after=30)
+    release.set()
+    plain.join()
+    assert sorted(sent) == ['0x7', '0x8']
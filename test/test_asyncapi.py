@@ -0,0 +1,28 @@
+from pyepm import asyncapi
+
+from helpers import config, mock_json_response
+
+def test_rpc_returns_future(mocker):
+    mocker.patch('requests.Session.post', return_value=mock_json_response(result=hex(42)))
+    with asyncapi.AsyncApi(config, max_in_flight=2) as instance:
+        futures = [instance.number() for _ in range(5)]
+        assert [f.result(timeout=5) for f in futures] == [42] * 5
+
+def test_wait_for_transaction(mocker):
+    mocker.patch('requests.Session.post', side_effect=[
+        mock_json_response(result={'blockNumber': None}),
+        mock_json_response(result={'blockNumber': '0x2a'})])
+    with asyncapi.AsyncApi(config, poll_interval=0.01) as instance:
+        assert instance.wait_for_transaction('0xdeadbeef').result(timeout=5) is True
+
+def test_wait_for_contract_retry(mocker):
+    mocker.patch('requests.Session.post', return_value=mock_json_response(result='0x'))
+    with asyncapi.AsyncApi(config, poll_interval=0.01) as instance:
+        assert instance.wait_for_contract('0xdeadbeef', retry=0.05).result(timeout=5) is False
+
+def test_wait_cancel(mocker):
+    mocker.patch('requests.Session.post', return_value=mock_json_response(result='0x'))
+    with asyncapi.AsyncApi(config, poll_interval=0.01) as instance:
+        future = instance.wait_for_contract('0xdeadbeef')
+        assert future.cancel()
+        assert future.cancelled()
@@ -0,0 +1,136 @@
+from pyepm import api, batch, deploy, nonces
+
+from helpers import config, mock_node
+
+SENDER = '0x8d3f2e6e5c6a3e5a4f6b8e5d0f2b4c8a1e3d5f7a'
+TOKEN = '0x6489ecbe173ac43dadb9f4f098c3e663e8438dd7'
+SIG = 'transfer:[address,int256]:int256'
+
+def token_node(sent, fail_data=(), too_low=(), counts=None, known=()):
+    """Node with transaction counts from `counts` in turn, or 5, rejecting nonces in `too_low`
+
+    Only the transactions sent or `known` are found by hash.
+    """
+    counts = iter(counts or [])
+
+    def answer(payload):
+        method = payload['method']
+        if method == 'eth_getTransactionCount':
+            return hex(next(counts, 5))
+        if method == 'eth_gasPrice':
+            return hex(10000000000000)
+        if method == 'eth_sendTransaction':
+            params = payload['params'][0]
+            if params['data'] in fail_data:
+                return {'code': -32000, 'message': 'Insufficient funds'}
+            if int(params['nonce'], 16) in too_low:
+                return {'code': -32000, 'message': 'Nonce too low'}
+            sent.append(params)
+            return '0x%064x' % int(params['nonce'], 16)
+        if method == 'eth_getTransactionByHash':
+            found = payload['params'][0] in known + ['0x%064x' % int(tx['nonce'], 16) for tx in sent]
+            return {'hash': payload['params'][0]} if found else None
+        if method == 'eth_getTransactionReceipt':
+            return {'transactionHash': payload['params'][0], 'blockNumber': '0x1'}
+    return mock_node(answer)
+
+def test_read_rows_csv(tmpdir):
+    rows = tmpdir.join('rows.csv')
+    rows.write("address,amount,memo\n%s,100,hello\n\n%s,-2,bye\n" % (TOKEN, SENDER))
+    assert list(batch.read_rows(str(rows))) == [[TOKEN, 100, 'hello'], [SENDER, -2, 'bye']]
+    assert list(batch.read_rows(str(rows), ['amount', 'address'])) == [[100, TOKEN], [-2, SENDER]]
+
+def test_read_rows_jsonl(tmpdir):
+    rows = tmpdir.join('rows.jsonl')
+    rows.write('{"address": "%s", "amount": 100}\n[1, 2]\n' % TOKEN)
+    assert list(batch.read_rows(str(rows))) == [[TOKEN, 100], [1, 2]]
+
+def test_batch_sender(mocker):
+    sent = []
+    mock_post = mocker.patch('requests.Session.post', side_effect=token_node(sent, fail_data=[api.abi_data(SIG, [TOKEN, 1])]))
+    mocker.patch('time.sleep')
+    instance = api.Api(config)
+    instance.batch_size = 2
+    rows = ([TOKEN, i] for i in range(5))
+    sender = batch.BatchSender(instance, window=3)
+    result = sender.run(rows, TOKEN, SIG, SENDER, 100000, 10000000000000, 0)
+
+    assert result == {'sent': 4, 'mined': 4, 'failed': 1, 'unconfirmed': 0}
+    # The nonce of the rejected transaction is reused by the next one
+    assert [int(params['nonce'], 16) for params in sent] == [5, 6, 7, 8]
+    assert [params['data'] for params in sent] == [api.abi_data(SIG, [TOKEN, i]) for i in [0, 2, 3, 4]]
+    # One batch per 2 rows, receipts checked together, never more than 3 unconfirmed
+    assert mock_post.call_count < 10
+
+def test_batch_sender_stuck_after_gap(mocker):
+    nonces.NonceManager._shared.clear()
+    sent = []
+    mocker.patch('requests.Session.post', side_effect=token_node(sent, fail_data=[api.abi_data(SIG, [TOKEN, 1])]))
+    mocker.patch('time.sleep')
+    instance = api.Api(config)
+    instance.batch_size = 5
+    sender = batch.BatchSender(instance)
+    result = sender.run(([TOKEN, i] for i in range(5)), TOKEN, SIG, SENDER, 100000, 10000000000000, 0)
+
+    # Nothing fills the rejected nonce 6, so 7 to 9 are never waited for
+    assert result == {'sent': 4, 'mined': 1, 'failed': 1, 'unconfirmed': 3}
+    assert instance.nonces(SENDER).released() == []
+
+def test_batch_sender_nonce_too_low(mocker):
+    nonces.NonceManager._shared.clear()
+    sent = []
+    mocker.patch('requests.Session.post', side_effect=token_node(sent, too_low=[5], counts=[5, 7]))
+    mocker.patch('time.sleep')
+    instance = api.Api(config)
+    instance.batch_size = 2
+    sender = batch.BatchSender(instance)
+    result = sender.run(([TOKEN, i] for i in range(3)), TOKEN, SIG, SENDER, 100000, 10000000000000, 0)
+
+    assert result == {'sent': 3, 'mined': 3, 'failed': 0, 'unconfirmed': 0}
+    assert [(int(params['nonce'], 16), params['data']) for params in sent] == [
+        (6, api.abi_data(SIG, [TOKEN, 1])), (7, api.abi_data(SIG, [TOKEN, 0])), (8, api.abi_data(SIG, [TOKEN, 2]))]
+
+def test_batch_sender_resume(mocker):
+    nonces.NonceManager._shared.clear()
+    sent = []
+    mocker.patch('requests.Session.post', side_effect=token_node(sent))
+    mocker.patch('time.sleep')
+    instance = api.Api(config)
+    instance.batch_size = 2
+    checkpoints = []
+    sender = batch.BatchSender(instance, checkpoint=checkpoints.append)
+    sender.run(([TOKEN, i] for i in range(4)), TOKEN, SIG, SENDER, 100000, 10000000000000, 0, wait=False)
+    assert checkpoints[-1]['rows'] == 0
+    assert [entry[0] for checkpoint in checkpoints for entry in checkpoint['sent']] == [0, 1, 2, 3]
+
+    # The last two transactions were dropped by the node, only their rows are sent again
+    resent = []
+    known = [entry[1] for entry in checkpoints[0]['sent']]
+    mocker.patch('requests.Session.post', side_effect=token_node(resent, known=known, counts=[7]))
+    sender = batch.BatchSender(instance)
+    result = sender.run(([TOKEN, i] for i in range(4)), TOKEN, SIG, SENDER, 100000, 10000000000000, 0, resume=checkpoints)
+    assert result == {'sent': 4, 'mined': 4, 'failed': 0, 'unconfirmed': 0}
+    assert [params['data'] for params in resent] == [api.abi_data(SIG, [TOKEN, i]) for i in [2, 3]]
+
+def test_deploy_batch(tmpdir, mocker):
+    tmpdir.join('rows.csv').write("address,amount\n%s,1\n%s,2\n" % (TOKEN, SENDER))
+    package = tmpdir.join('package.yaml')
+    package.write("""
+-
+  batch:
+    Airdrop:
+      file: rows.csv
+      to: $Token
+      from: "%s"
+      sig: transfer:[address,int256]:int256
+      wait: True
+""" % SENDER)
+    deployment = deploy.Deploy(str(package), config)
+    deployment.plan = deployment.steps(deployment.load_yaml())
+    deployment.replace('Token', deployment.plan, TOKEN)
+    deployment.path = str(tmpdir)
+    sent = []
+    mocker.patch('requests.Session.post', side_effect=token_node(sent))
+    mocker.patch('time.sleep')
+    assert deployment.batch_step(deployment.plan[0]) == {'sent': 2, 'mined': 2, 'failed': 0, 'unconfirmed': 0}
+    assert [params['to'] for params in sent] == [TOKEN, TOKEN]
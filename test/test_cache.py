@@ -0,0 +1,193 @@
+from pyepm import api, cache, config as c
+
+from helpers import COW_ADDRESS, config, mock_json_response
+
+URL = 'http://127.0.0.1:8545'
+
+def test_gas_price_cache(mocker):
+    prices = cache.GasPriceCache(ttl=10)
+    fetch = mocker.Mock(return_value=42)
+    assert prices.get(fetch) == 42
+    assert prices.get(fetch) == 42
+    assert fetch.call_count == 1
+    assert prices.stats() == {'hits': 1, 'misses': 1}
+
+    prices.invalidate()
+    assert prices.get(fetch) == 42
+    assert fetch.call_count == 2
+
+def test_gas_price_cache_expires(mocker):
+    prices = cache.GasPriceCache(ttl=0)
+    fetch = mocker.Mock(return_value=42)
+    prices.get(fetch)
+    prices.get(fetch)
+    assert fetch.call_count == 2
+
+def test_gas_price_cache_shared(mocker):
+    instance = api.Api(config)
+    assert instance.gas_prices is api.Api(config).gas_prices
+    settings = c.get_default_config()
+    settings.set('deploy', 'gas_price_ttl', '60')
+    assert api.Api(settings).gas_prices.ttl == 60
+    instance.gas_prices.invalidate()
+    mock_post = mocker.patch('requests.Session.post', return_value=mock_json_response(result=hex(10000000000000)))
+    instance.transact(COW_ADDRESS)
+    api.Api(config).transact(COW_ADDRESS)
+    assert mock_post.call_count == 3  # one eth_gasPrice, two eth_sendTransaction
+
+def test_call_skips_gas_price(mocker):
+    instance = api.Api(config)
+    mock_rpc_post = mocker.patch.object(instance, '_rpc_post', return_value=None)
+    instance.call(COW_ADDRESS)
+    assert mock_rpc_post.call_count == 1
+    assert mock_rpc_post.call_args[0][0] == 'eth_call'
+
+def test_call_cache_latest(mocker):
+    calls = cache.CallCache(size=10, interval=0)
+    fetch = mocker.Mock(return_value='0x2a')
+    head = mocker.Mock(side_effect=[1, 1, 2])
+    assert calls.get(('eth_call', COW_ADDRESS), 'latest', fetch, head) == '0x2a'
+    assert calls.get(('eth_call', COW_ADDRESS), 'latest', fetch, head) == '0x2a'
+    assert fetch.call_count == 1
+    assert calls.get(('eth_call', COW_ADDRESS), 'latest', fetch, head) == '0x2a'
+    assert fetch.call_count == 2
+    assert calls.stats() == {'hits': 1, 'misses': 2, 'size': 1, 'head': 2}
+
+def test_call_cache_fixed_block(mocker):
+    calls = cache.CallCache(size=1, interval=0)
+    fetch = mocker.Mock(return_value='0x2a')
+    head = mocker.Mock()
+    calls.get(('eth_call', COW_ADDRESS), '0x10', fetch, head)
+    calls.get(('eth_call', COW_ADDRESS), 16, fetch, head)
+    calls.get(('eth_call', COW_ADDRESS), 'pending', fetch, head)
+    calls.get(('eth_call', COW_ADDRESS), 'pending', fetch, head)
+    assert fetch.call_count == 3
+    assert not head.called
+
+    calls.get(('eth_call', COW_ADDRESS), 17, fetch, head)
+    calls.get(('eth_call', COW_ADDRESS), 16, fetch, head)
+    assert fetch.call_count == 5
+
+def test_call_cache_invalidate(mocker):
+    calls = cache.CallCache(size=10, interval=60)
+    fetch = mocker.Mock(return_value='0x2a')
+    head = mocker.Mock(side_effect=[1, 2])
+    calls.get(('eth_call', COW_ADDRESS), 'latest', fetch, head)
+    calls.get(('eth_call', COW_ADDRESS), 'latest', fetch, head)
+    assert fetch.call_count == 1
+    calls.invalidate()
+    calls.get(('eth_call', COW_ADDRESS), 'latest', fetch, head)
+    assert fetch.call_count == 2
+    assert calls.stats()['head'] == 2
+
+def test_call_cache_shared():
+    settings = c.get_default_config()
+    settings.set('api', 'call_cache', '10')
+    instance = api.Api(settings)
+    assert instance.call_cache is api.Api(settings).call_cache
+    settings.set('api', 'call_cache_interval', '5')
+    assert api.Api(settings).call_cache.interval == 5
+
+def test_api_call_cache(mocker):
+    instance = api.Api(config)
+    instance.call_cache = cache.CallCache(size=10, interval=60)
+    mock_post = mocker.patch('requests.Session.post', return_value=mock_json_response(result=hex(21)))
+    sig = 'multiply:[int256]:int256'
+    assert instance.call(COW_ADDRESS, sig, [3]) == [21]
+    assert instance.call(COW_ADDRESS, sig, [3]) == [21]
+    assert instance.storage_at(COW_ADDRESS, 1) == hex(21)
+    assert instance.storage_at(COW_ADDRESS, 1) == hex(21)
+    assert mock_post.call_count == 3  # eth_blockNumber, eth_call, eth_getStorageAt
+
+def test_call_cache_new_block(mocker):
+    api.BlockFilter._shared.clear()
+    instance = api.Api(config)
+    instance.wait_mode = 'filter'
+    instance.call_cache = cache.CallCache(size=10, interval=60)
+    mocker.patch('time.sleep')
+    mocker.patch('requests.Session.post', side_effect=[
+        mock_json_response(result='0x1'),  # eth_blockNumber
+        mock_json_response(result=hex(21)),  # eth_call
+        mock_json_response(result='0x1'),  # eth_newBlockFilter
+        mock_json_response(result={'blockNumber': None}),
+        mock_json_response(result=['0x806eee83f9aaa349031bd0dccd50241cc898c65cd36b8fa53aaaee3638d27488']),
+        mock_json_response(result={'blockNumber': '0x2'}),
+        mock_json_response(result='0x2'),  # eth_blockNumber
+        mock_json_response(result=hex(42))])  # eth_call
+    sig = 'multiply:[int256]:int256'
+    assert instance.call(COW_ADDRESS, sig, [3]) == [21]
+    assert instance.wait_for_transaction('0x01')
+    assert instance.call(COW_ADDRESS, sig, [3]) == [42]
+
+def test_chain_cache_confirmations(mocker, tmpdir):
+    chain = cache.ChainCache(str(tmpdir.join('chain.db')), size=1024 * 1024, confirmations=12, interval=0)
+    transaction = {'hash': '0x01', 'blockNumber': '0x64'}
+    fetch = mocker.Mock(return_value=transaction)
+    head = mocker.Mock(side_effect=[105, 112])
+    genesis = mocker.Mock(return_value='0xgenesis')
+
+    def block_of(tx):
+        return int(tx['blockNumber'], 16)
+
+    assert chain.get(URL, 'eth_getTransactionByHash', ['0x01'], fetch, block_of, head, genesis) == transaction
+    assert chain.get(URL, 'eth_getTransactionByHash', ['0x01'], fetch, block_of, head, genesis) == transaction
+    assert fetch.call_count == 2  # only 5 confirmations
+    assert chain.get(URL, 'eth_getTransactionByHash', ['0x01'], fetch, block_of, head, genesis) == transaction
+    assert fetch.call_count == 2
+    assert genesis.call_count == 1
+    assert chain.stats()['hits'] == 1
+
+    # Shared across runs
+    chain = cache.ChainCache(str(tmpdir.join('chain.db')), size=1024 * 1024, confirmations=12)
+    assert chain.get(URL, 'eth_getTransactionByHash', ['0x01'], fetch, block_of, lambda: 200, lambda: '0xgenesis') == transaction
+    assert fetch.call_count == 2
+    assert chain.get('http://10.0.0.1:8545', 'eth_getTransactionByHash', ['0x01'], fetch, block_of,
+                     lambda: 200, lambda: '0xother') == transaction
+    assert fetch.call_count == 3
+
+def test_chain_cache_first_seen(mocker, tmpdir):
+    chain = cache.ChainCache(str(tmpdir.join('chain.db')), size=1024 * 1024, confirmations=2, interval=0)
+    fetch = mocker.Mock(side_effect=['0x', '0xdeadbeef', '0xdeadbeef', '0xdeadbeef'])
+    head = mocker.Mock(side_effect=[10, 11, 12, 13])
+
+    def block_of(code):
+        return True if code != '0x' else None
+    for _ in range(5):
+        chain.get(URL, 'eth_getCode', [COW_ADDRESS, 'latest'], fetch, block_of, head, lambda: '0xgenesis')
+    assert fetch.call_count == 3
+    assert head.call_count == 4
+
+def test_chain_cache_reorg(mocker, tmpdir):
+    chain = cache.ChainCache(str(tmpdir.join('chain.db')), size=1024 * 1024, confirmations=12, interval=0)
+    mined = {'hash': '0x01', 'blockNumber': '0x64'}
+    fetch = mocker.Mock(side_effect=[mined, {'hash': '0x01', 'blockNumber': None}, mined])
+
+    def block_of(tx):
+        return int(tx['blockNumber'], 16) if tx['blockNumber'] else None
+    for head in [105, 106]:
+        chain.get(URL, 'eth_getTransactionByHash', ['0x01'], fetch, block_of, lambda: head, lambda: '0xgenesis')
+    # Un-mined by a reorg, so it isn't served once its old block is confirmed
+    assert chain.stats()['entries'] == 0
+    chain.get(URL, 'eth_getTransactionByHash', ['0x01'], fetch, block_of, lambda: 200, lambda: '0xgenesis')
+    assert fetch.call_count == 3
+
+def test_chain_cache_eviction(tmpdir):
+    chain = cache.ChainCache(str(tmpdir.join('chain.db')), size=200, confirmations=0)
+    for i in range(10):
+        chain.get(URL, 'eth_getBlockByNumber', [hex(i), False], lambda: {'number': i, 'pad': 'x' * 30},
+                  lambda block: block['number'], lambda: 100, lambda: '0xgenesis')
+    stats = chain.stats()
+    assert stats['bytes'] <= 200
+    assert 0 < stats['entries'] < 10
+
+def test_api_chain_cache(mocker, tmpdir):
+    instance = api.Api(config)
+    instance.chain_cache = cache.ChainCache(str(tmpdir.join('chain.db')), size=1024 * 1024, confirmations=12)
+    receipt = {'blockNumber': '0x1', 'contractAddress': '0x6489ecbe173ac43dadb9f4f098c3e663e8438dd7'}
+    mock_post = mocker.patch('requests.Session.post', side_effect=[
+        mock_json_response(result={'hash': '0xgenesis'}),
+        mock_json_response(result=receipt),
+        mock_json_response(result=hex(100))])
+    assert instance.get_contract_address('0x01') == receipt['contractAddress']
+    assert instance.get_contract_address('0x01') == receipt['contractAddress']
+    assert mock_post.call_count == 3
@@ -0,0 +1,72 @@
+import json
+import pytest
+
+from ethereum import abi
+
+from pyepm import codec
+
+def reference(types, data):
+    return abi.encode_abi(types, data).encode('hex')
+
+def test_compile_signature():
+    signature = codec.compile_signature('register:[int256,int256]:int256')
+    assert signature is codec.compile_signature('register:[int256,int256]:int256')
+    assert signature.name == 'register'
+    assert signature.types == ['int256', 'int256']
+    assert signature.outputs == ['int256']
+    assert signature.prefix == '0x8195cea6'
+
+def test_compile_signature_no_args():
+    signature = codec.compile_signature('get_stats:[]:int256[]')
+    assert signature.types == []
+    assert signature.outputs == ['int256[]']
+    assert signature.encode([]) == '0x61837e41'
+
+@pytest.mark.parametrize('types,data', [
+    (['int256'], [3]),
+    (['int256', 'int256'], [-1, 2 ** 255 - 1]),
+    (['int256', 'int256'], ['0x72ba7d8e73fe8eb666ea66babc8116a41bfb10e2', 'SubcurrencyName']),
+    (['int256', 'int256', 'int256'], [1, 42, '\x01\x00']),
+    (['uint256', 'address', 'bytes32'], [7, '72ba7d8e73fe8eb666ea66babc8116a41bfb10e2', 'name']),
+    (['int256[]', 'bytes'], [[1, 2, 3], 'dynamic']),
+])
+def test_encode_matches_generic_encoder(types, data):
+    signature = codec.compile_signature('f:[%s]:int256' % ','.join(types))
+    expected = [int(d, 16) if isinstance(d, str) and d[:2] == '0x' else d for d in data]
+    assert signature.encode(data) == signature.prefix + reference(types, expected)
+
+def test_encode_out_of_bounds():
+    signature = codec.compile_signature('f:[uint256]:int256')
+    with pytest.raises(abi.ValueOutOfBounds):
+        signature.encode([-1])
+
+def word(value):
+    return '%064x' % (value % 2 ** 256)
+
+@pytest.mark.parametrize('typ,value,expected', [
+    ('int256', -1, -1),
+    ('uint256', -1, 2 ** 256 - 1),
+    ('address', 0x72ba7d8e73fe8eb666ea66babc8116a41bfb10e2, '72ba7d8e73fe8eb666ea66babc8116a41bfb10e2'),
+    ('bool', 1, True),
+])
+def test_decode_static(typ, value, expected):
+    signature = codec.compile_signature('f:[]:%s' % typ)
+    assert signature.decode('0x' + word(value)) == [expected]
+    assert signature.decode('0x') == []
+
+def test_decode_array():
+    signature = codec.compile_signature('f:[]:int256[]')
+    items = range(-500, 500)
+    assert signature.decode('0x' + word(32) + word(len(items)) + ''.join(word(i) for i in items)) == items
+
+def test_decode_bytes():
+    signature = codec.compile_signature('f:[]:bytes')
+    data = 'x' * 100
+    result = '0x' + word(32) + word(len(data)) + data.encode('hex') + '00' * 28
+    assert signature.decode(json.loads(json.dumps(result))) == [data]  # unicode, as returned by the node
+
+@pytest.mark.parametrize('sig', ['f:[]:int256[]', 'f:[]:bytes', 'f:[]:int256'])
+def test_decode_falls_back_to_words(sig):
+    # Serpent style array return, not ABI encoded
+    result = '0x' + word(3) + word(2) + word(1) + word(0)
+    assert codec.compile_signature(sig).decode(result) == [3, 2, 1, 0]
@@ -0,0 +1,89 @@
+import json
+import os
+import pytest
+
+from pyepm import compiler
+
+from helpers import config, is_hex
+
+NAMECOIN = open('test/fixtures/namecoin.se').read()
+
+def test_sources_follow_includes(tmpdir):
+    tmpdir.join('lib.se').write(NAMECOIN)
+    main = tmpdir.join('main.se')
+    main.write('x = create("lib.se")\n')
+    found = compiler.sources(str(main), compiler.SERPENT_INCLUDES)
+    assert [os.path.basename(path) for path, _ in found] == ['main.se', 'lib.se']
+
+def test_compile_cache(tmpdir, mocker):
+    contract = tmpdir.join('namecoin.se')
+    contract.write(NAMECOIN)
+    instance = compiler.Compiler(config)
+    instance.cache = compiler.CompileCache(str(tmpdir.join('compiled')), 10)
+    compile_serpent = mocker.spy(compiler, 'compile_serpent')
+
+    code = instance.serpent(str(contract))
+    assert is_hex(code)
+    assert instance.serpent(str(contract)) == code
+    assert compile_serpent.call_count == 1
+    assert instance.stats() == {'hits': 1, 'misses': 1, 'evictions': 0}
+
+    contract.write(NAMECOIN + '\n\n')
+    instance.serpent(str(contract))
+    assert compile_serpent.call_count == 2
+
+def test_compile_cache_evicts(tmpdir):
+    cache = compiler.CompileCache(str(tmpdir), 2)
+    for i in range(3):
+        path = os.path.join(str(tmpdir), "%s.json" % i)
+        cache.set(str(i), {'contracts': []})
+        os.utime(path, (i, i))
+    cache.set('3', {'contracts': []})
+    assert sorted(os.listdir(str(tmpdir))) == ['2.json', '3.json']
+    assert cache.get('0') is None
+    assert cache.get('3') == {'contracts': []}
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 2}
+
+def test_start_compiles_ahead(tmpdir, mocker):
+    contract = tmpdir.join('namecoin.se')
+    contract.write(NAMECOIN)
+    instance = compiler.Compiler(config)
+    instance.cache = None
+    instance.start([('serpent', str(contract), None)])
+    assert len(instance.pending) == 1
+    instance.wait()
+    compile_serpent = mocker.spy(compiler, 'compile_serpent')
+    assert is_hex(instance.serpent(str(contract)))
+    assert compile_serpent.call_count == 0
+
+def test_start_reports_errors(tmpdir):
+    contract = tmpdir.join('broken.se')
+    contract.write('def broken(:\n')
+    instance = compiler.Compiler(config)
+    instance.cache = None
+    instance.start([('serpent', str(contract), None)])
+    with pytest.raises(Exception) as excinfo:
+        instance.wait()
+    assert str(excinfo.value).startswith("Failed to compile %s" % contract)
+
+def test_compile_solidity_combined_json(mocker):
+    output = json.dumps({'contracts': {
+        'a.sol:Owned': {'abi': '[]', 'bin': '6060'},
+        'b.sol:Wallet': {'abi': '[{"type": "function", "name": "kill"}]', 'bin': '6061'}}})
+    popen = mocker.patch('subprocess.Popen')
+    popen.return_value.communicate.return_value = (output, '')
+    popen.return_value.returncode = 0
+
+    result = compiler.compile_solidity(['a.sol', 'b.sol'], ['Wallet', 'Owned'])
+    assert popen.call_count == 1
+    assert popen.call_args[0][0] == ['solc', '--combined-json', 'abi,bin', 'a.sol', 'b.sol']
+    assert result['contracts'] == [['Wallet', '0x6061'], ['Owned', '0x6060']]
+    assert result['signatures']['Wallet'] == [{'type': 'function', 'name': 'kill'}]
+
+def test_compile_solidity_errors(mocker):
+    popen = mocker.patch('subprocess.Popen')
+    popen.return_value.communicate.return_value = ('', 'a.sol:1:1: Error: Expected pragma\n')
+    popen.return_value.returncode = 1
+    with pytest.raises(Exception) as excinfo:
+        compiler.compile_solidity('a.sol', ['Wallet'])
+    assert str(excinfo.value) == "solc failed: a.sol:1:1: Error: Expected pragma"
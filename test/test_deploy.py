@@ -1,8 +1,10 @@
+import os
 import pytest
 
-from pyepm import deploy
+from pyepm import config as c, deploy, nonces
+from pyepm.utils import config_dir
 
-from helpers import config, has_solc, is_hex, mock_json_response, solc
+from helpers import config, has_solc, is_hex, mock_json_response, mock_node, solc
 
 def test_load_yaml():
     deployment = deploy.Deploy('test/fixtures/example.yaml', config)
@@ -116,7 +118,7 @@ def test_load_yaml():
 
 def test_deploy(mocker):
     deployment = deploy.Deploy('test/fixtures/example.yaml', config)
-    mocker.patch('requests.post', return_value=mock_json_response(status_code=200, result='0x01'))
+    mocker.patch('requests.Session.post', return_value=mock_json_response(status_code=200, result='0x01'))
     mocker.patch('time.sleep')
     if not has_solc:
         with pytest.raises(Exception) as excinfo:
@@ -136,3 +138,121 @@ def test_compile_solidity(mocker):
     for idx, (contract_name, code) in enumerate(contracts):
         assert contract_name == contract_names[idx]
         assert is_hex(code)
+
+def test_dependencies():
+    deployment = deploy.Deploy('test/fixtures/example.yaml', config)
+    deployment.definitions = deployment.load_yaml()
+    steps = deployment.steps(deployment.definitions)
+    assert [(step.key, step.name) for step in steps] == [
+        ('set', None), ('deploy', 'NameCoin'), ('deploy', 'Subcurrency'),
+        ('transact', 'RegisterSubToNameCoin'), ('transact', 'TestEncoding'), ('call', 'GetNameFromNameCoin'),
+        ('deploy', 'extra'), ('deploy', 'Wallet'), ('transact', 'ToWallet')]
+    assert deployment.dependencies(steps) == [
+        set(), set(), set(), {1, 2}, {0, 2}, {1, 2, 3}, set(), set(), {7}]
+
+def test_schedule(mocker):
+    deployment = deploy.Deploy('test/fixtures/example.yaml', config)
+    deployment.definitions = deployment.load_yaml()
+    steps = deployment.steps(deployment.definitions)
+    dependencies = deployment.dependencies(steps)
+    finished = []
+
+    def run_step(step):
+        i = steps.index(step)
+        assert dependencies[i] <= set(finished)
+        finished.append(i)
+    mocker.patch.object(deployment, 'run_step', side_effect=run_step)
+    deployment.schedule(steps, 4)
+    assert sorted(finished) == range(len(steps))
+
+def test_schedule_failure(mocker):
+    deployment = deploy.Deploy('test/fixtures/example.yaml', config)
+    deployment.definitions = deployment.load_yaml()
+    steps = deployment.steps(deployment.definitions)
+    mocker.patch.object(deployment, 'run_step', side_effect=Exception("Deploy failed"))
+    with pytest.raises(Exception) as excinfo:
+        deployment.schedule(steps, 4)
+    assert excinfo.value.message == "Deploy failed"
+
+def test_compile_jobs():
+    deployment = deploy.Deploy('test/fixtures/example.yaml', config)
+    deployment.path = 'test/fixtures'
+    assert deployment.compile_jobs(deployment.steps(deployment.load_yaml())) == [
+        ('serpent', 'test/fixtures/namecoin.se', None),
+        ('serpent', 'test/fixtures/subcurrency.se', None),
+        ('serpent', 'test/fixtures/short_namecoin.se', None),
+        ('solidity', 'test/fixtures/wallet.sol', ['multiowned', 'daylimit', 'multisig', 'Wallet'])]
+
+def test_load_plan_cached(tmpdir, mocker):
+    package = tmpdir.join('package.yaml')
+    package.write(open('test/fixtures/example.yaml').read())
+    deployment = deploy.Deploy(str(package), config)
+    definitions, steps = deployment.load_plan()
+    assert definitions == deployment.load_yaml()
+    assert steps == deployment.steps(definitions)
+
+    load_yaml = mocker.spy(deployment, 'load_yaml')
+    assert deployment.load_plan() == (definitions, steps)
+    assert load_yaml.call_count == 0
+
+    package.write(open('test/fixtures/example.yaml').read().replace('retry: 15', 'retry: 16'))
+    definitions, steps = deployment.load_plan()
+    assert load_yaml.call_count == 1
+    assert steps[1].retry == 16
+
+    # Plans cached by another version of the steps are compiled again
+    mocker.patch.object(deploy, 'PLAN_VERSION', deploy.PLAN_VERSION + 1)
+    deployment.load_plan()
+    assert load_yaml.call_count == 2
+
+def test_load_plan_evicted(tmpdir):
+    settings = c.get_default_config()
+    settings.set('misc', 'plan_cache_size', '1')
+    for name in ['first.yaml', 'second.yaml']:
+        tmpdir.join(name).write(open('test/fixtures/example.yaml').read())
+        deploy.Deploy(str(tmpdir.join(name)), settings).load_plan()
+    assert len(os.listdir(os.path.join(config_dir.path, 'plans'))) == 1
+
+def mock_creations(mocker, addresses):
+    """Answers a node's calls for contracts created with nonces from 0, mined at `addresses`"""
+    def answer(payload):
+        if payload['method'] == 'eth_getTransactionCount':
+            return '0x0'
+        if payload['method'] == 'eth_gasPrice':
+            return hex(50000000000)
+        if payload['method'] == 'eth_sendTransaction':
+            return payload['params'][0]['nonce']
+        return {'blockNumber': '0x1', 'contractAddress': addresses[int(payload['params'][0], 16)]}
+    mocker.patch('requests.Session.post', side_effect=mock_node(answer))
+    mocker.patch('time.sleep')
+
+def predicting_deploy(mocker):
+    nonces.NonceManager._shared.clear()
+    settings = c.get_default_config()
+    settings.set('deploy', 'local_nonces', 'True')
+    settings.set('deploy', 'predict_addresses', 'True')
+    deployment = deploy.Deploy('test/fixtures/example.yaml', settings)
+    mocker.patch.object(deployment.compiler, 'serpent', return_value='0x6000')
+    return deployment
+
+def test_create_predicted(mocker):
+    sender = '0x6ac7ea33f8831ea9dcc53393aaa88b25a785dbf0'
+    addresses = ['0xcd234a471b72ba2f1ccf0a70fcaba648a5eecd8d', '0x343c43a37d37dff08ae8c4a11544c718abb4fcf8']
+    deployment = predicting_deploy(mocker)
+    mock_creations(mocker, addresses)
+    first = deployment.create('first.se', sender, 100000, 50000000000, 0, False, False, False, 'First')
+    second = deployment.create('second.se', sender, 100000, 50000000000, 0, False, False, False, 'Second')
+    # Addresses are returned before the creations are mined
+    assert [first, second] == addresses
+    assert deployment.tx_hashes == {'First': '0x0', 'Second': '0x1'}
+    deployment.confirm_creations()
+    assert deployment.predicted == {}
+
+def test_create_predicted_mismatch(mocker):
+    deployment = predicting_deploy(mocker)
+    mock_creations(mocker, ['0x' + '1' * 40])
+    deployment.create('first.se', '0x6ac7ea33f8831ea9dcc53393aaa88b25a785dbf0', 100000, 50000000000, 0,
+                      False, False, False, 'First')
+    with pytest.raises(Exception) as excinfo:
+        deployment.confirm_creations()
+    assert "instead of" in str(excinfo.value)
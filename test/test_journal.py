@@ -0,0 +1,89 @@
+import os
+import shutil
+import pytest
+
+from pyepm import deploy, journal
+
+from helpers import config
+
+ADDRESS = '0x6489ecbe173ac43dadb9f4f098c3e663e8438dd7'
+
+PACKAGE = """
+-
+  set:
+    NameReg: "0x72ba7d8e73fe8eb666ea66babc8116a41bfb10e2"
+-
+  deploy:
+    NameCoin:
+      contract: namecoin.se
+-
+  call:
+    GetName:
+      to: $NameCoin
+      sig: get_name:[int256]:int256
+      data:
+        - $NameReg
+"""
+
+def test_journal_records(tmpdir):
+    path = str(tmpdir.join('package.journal'))
+    j = journal.Journal(path)
+    assert j.open() == []
+    assert not os.path.exists(path)
+    j.record({'step': [0, 'set', None]})
+    j.record({'step': [1, 'deploy', 'NameCoin']})
+    j.close()
+
+    # A partly written line from a crash is dropped when resuming
+    with open(path, 'a') as f:
+        f.write('{"step": [2, ')
+    j = journal.Journal(path)
+    assert j.open(resume=True) == [{'step': [0, 'set', None]}, {'step': [1, 'deploy', 'NameCoin']}]
+    j.record({'step': [2, 'call', 'GetName']})
+    j.close()
+    assert len(j.load()) == 3
+
+    j.close(remove=True)
+    assert not os.path.exists(path)
+
+def test_deploy_resume(tmpdir, mocker):
+    shutil.copy('test/fixtures/namecoin.se', str(tmpdir))
+    package = tmpdir.join('package.yaml')
+    package.write(PACKAGE)
+    create = mocker.patch.object(deploy.Deploy, 'create', return_value=ADDRESS)
+    call = mocker.patch.object(deploy.Deploy, 'call', side_effect=Exception("Node went away"))
+
+    with pytest.raises(Exception):
+        deploy.Deploy(str(package), config).deploy()
+    assert os.path.exists(journal.Journal.path_for(str(package)))
+
+    call.side_effect = None
+    call.return_value = [0]
+    config.set('deploy', 'resume', 'True')
+    try:
+        deploy.Deploy(str(package), config).deploy()
+    finally:
+        config.set('deploy', 'resume', 'False')
+    assert create.call_count == 1
+    assert call.call_count == 2
+    assert call.call_args[0][0] == ADDRESS
+    assert call.call_args[0][3] == ['0x72ba7d8e73fe8eb666ea66babc8116a41bfb10e2']
+    assert not os.path.exists(journal.Journal.path_for(str(package)))
+
+def test_journal_encodes_bytes(tmpdir):
+    j = journal.Journal(str(tmpdir.join('package.journal')))
+    j.record({'step': [0, 'call', 'GetHash'], 'result': ['\xff' * 32, 'name', 42]})
+    j.close()
+    assert j.load()[0]['result'] == ['0x' + 'ff' * 32, 'name', 42]
+
+def test_resume_batch_progress(tmpdir):
+    package = tmpdir.join('package.yaml')
+    package.write(PACKAGE)
+    deployment = deploy.Deploy(str(package), config)
+    deployment.plan = deployment.steps(deployment.load_yaml())
+    progress = {'rows': 100, 'sent': [[100, '0x01', 7]]}
+    steps = deployment.resume(deployment.plan, [{'step': [0, 'set', None], 'replace': []},
+                                                {'step': [2, 'batch', 'Airdrop'], 'batch': progress}])
+    # A batch step with progress isn't done yet
+    assert len(steps) == len(deployment.plan) - 1
+    assert deployment.batches == {(2, 'batch', 'Airdrop'): [progress]}
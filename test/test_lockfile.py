@@ -0,0 +1,112 @@
+import json
+import shutil
+
+from pyepm import api, deploy, lockfile
+
+from helpers import config, mock_batch_post
+
+ADDRESS = '0x6489ecbe173ac43dadb9f4f098c3e663e8438dd7'
+TX_HASH = '0x5d2306fce34c1e3a5e9f2ba14e1a0f05eb1d2ab8fbac1e2a5d0a7e85a8b60a53'
+
+PACKAGE = """
+-
+  deploy:
+    NameCoin:
+      contract: namecoin.se
+"""
+
+def test_path_for():
+    assert lockfile.Lockfile.path_for('test/fixtures/example.yaml') == 'test/fixtures/example.lock.json'
+
+def test_verify(tmpdir, mocker):
+    lock = lockfile.Lockfile(str(tmpdir.join('package.lock.json')))
+    lock.set('NameCoin', '6060', {}, [TX_HASH], [ADDRESS])
+    lock.set('Missing', '6061', {}, [TX_HASH], ['0x01'])
+    mock_post = mocker.patch('requests.Session.post', side_effect=mock_batch_post(['0x', '0x60606040']))
+    assert lock.verify(api.Api(config)) == {'NameCoin'}
+    assert mock_post.call_count == 1
+
+    assert lock.get('NameCoin', '6060', {}) == [ADDRESS]
+    assert lock.get('NameCoin', '6062', {}) is None
+    assert lock.get('NameCoin', '6060', {'value': 1}) is None
+    assert lock.get('Missing', '6061', {}) is None
+
+    # Code replaced at the same address
+    mocker.patch('requests.Session.post', side_effect=mock_batch_post(['0x', '0x60606041']))
+    assert lock.verify(api.Api(config)) == set()
+
+def test_deploy_reuses_unchanged(tmpdir, mocker):
+    shutil.copy('test/fixtures/namecoin.se', str(tmpdir))
+    package = tmpdir.join('package.yaml')
+    package.write(PACKAGE)
+    config.set('deploy', 'lockfile', 'True')
+    try:
+        deployment = deploy.Deploy(str(package), config)
+        mocker.patch('time.sleep')
+        create = mocker.patch.object(deploy.Deploy, 'create', return_value=ADDRESS)
+        mocker.patch.object(deploy.Deploy, 'try_create', return_value=TX_HASH)
+        deployment.deploy()
+        assert create.call_count == 1
+        state = json.load(open(str(tmpdir.join('package.lock.json'))))
+        assert state['contracts']['NameCoin']['addresses'] == [ADDRESS]
+
+        mocker.patch('requests.Session.post', side_effect=mock_batch_post(['0x60606040']))
+        deploy.Deploy(str(package), config).deploy()
+        assert create.call_count == 1
+
+        tmpdir.join('namecoin.se').write(open('test/fixtures/namecoin.se').read().replace('return(1)', 'return(2)'))
+        mocker.patch('requests.Session.post', side_effect=mock_batch_post(['0x60606040']))
+        deploy.Deploy(str(package), config).deploy()
+        assert create.call_count == 2
+    finally:
+        config.set('deploy', 'lockfile', 'False')
+
+def test_deploy_skips_sent_transactions(tmpdir, mocker):
+    shutil.copy('test/fixtures/namecoin.se', str(tmpdir))
+    package = tmpdir.join('package.yaml')
+    package.write(PACKAGE + """
+-
+  set:
+    NameReg: "0x72ba7d8e73fe8eb666ea66babc8116a41bfb10e2"
+-
+  transact:
+    Register:
+      to: $NameCoin
+      sig: register:[int256,int256]:int256
+      data:
+        - $NameCoin
+        - NameCoin
+-
+  transact:
+    RegisterNameReg:
+      to: $NameCoin
+      sig: register:[int256,int256]:int256
+      data:
+        - $NameReg
+        - NameReg
+""")
+    config.set('deploy', 'lockfile', 'True')
+    try:
+        mocker.patch('time.sleep')
+        create = mocker.patch.object(deploy.Deploy, 'create', return_value=ADDRESS)
+        transact = mocker.patch.object(deploy.Deploy, 'transact', return_value=TX_HASH)
+        deploy.Deploy(str(package), config).deploy()
+        assert transact.call_count == 2
+
+        # Only the transaction using a $variable that isn't from the lockfile is sent again
+        mocker.patch('requests.Session.post', side_effect=mock_batch_post(['0x60606040']))
+        deploy.Deploy(str(package), config).deploy()
+        assert create.call_count == 1
+        assert transact.call_count == 3
+        assert transact.call_args[0][3][0] == "0x72ba7d8e73fe8eb666ea66babc8116a41bfb10e2"
+
+        # A redeployed contract gets its transactions again
+        create.return_value = '0x72ba7d8e73fe8eb666ea66babc8116a41bfb10e3'
+        tmpdir.join('namecoin.se').write(open('test/fixtures/namecoin.se').read().replace('return(1)', 'return(2)'))
+        mocker.patch('requests.Session.post', side_effect=mock_batch_post(['0x60606040']))
+        deploy.Deploy(str(package), config).deploy()
+        assert transact.call_count == 5
+        state = json.load(open(str(tmpdir.join('package.lock.json'))))
+        assert [entry['inputs']['to'] for entry in state['transactions'].values()] == [create.return_value]
+    finally:
+        config.set('deploy', 'lockfile', 'False')
@@ -0,0 +1,79 @@
+import pytest
+import requests
+
+from pyepm import api, nonces
+
+from helpers import COW_ADDRESS, config, mock_json_response
+
+def test_nonces(mocker):
+    instance = api.Api(config)
+    post = mocker.patch('requests.Session.post', return_value=mock_json_response(result=hex(5)))
+    manager = nonces.NonceManager(instance, COW_ADDRESS)
+    assert [manager.next() for _ in range(3)] == [5, 6, 7]
+    assert post.call_count == 1
+
+    manager.release(6)
+    assert manager.next() == 6
+    assert manager.next() == 8
+
+def test_send_releases_failed_nonce(mocker):
+    instance = api.Api(config)
+    mocker.patch('requests.Session.post', return_value=mock_json_response(result=hex(5)))
+    manager = nonces.NonceManager(instance, COW_ADDRESS)
+
+    def fail(nonce):
+        raise api.ApiException(-32000, "Insufficient funds")
+    with pytest.raises(api.ApiException):
+        manager.send(fail)
+    assert manager.next() == 5
+
+def test_send_resyncs_after_timeout(mocker):
+    instance = api.Api(config)
+    post = mocker.patch('requests.Session.post', return_value=mock_json_response(result=hex(5)))
+    manager = nonces.NonceManager(instance, COW_ADDRESS)
+
+    def timeout(nonce):
+        raise requests.Timeout("Read timed out")
+    with pytest.raises(requests.Timeout):
+        manager.send(timeout)
+    # The node may have the transaction, its nonce isn't handed out again blindly
+    post.return_value = mock_json_response(result=hex(6))
+    assert manager.next() == 6
+    assert post.call_count == 2
+
+def test_send_resyncs_on_nonce_too_low(mocker):
+    instance = api.Api(config)
+    instance.fixed_price = True
+    mocker.patch('requests.Session.post', side_effect=[
+        mock_json_response(result=hex(5)),
+        mock_json_response(error={'code': -32000, 'message': 'Nonce too low'}),
+        mock_json_response(result=hex(9)),
+        mock_json_response(result='0xdeadbeef')])
+    manager = nonces.NonceManager(instance, COW_ADDRESS)
+    sent = []
+
+    def send(nonce):
+        sent.append(nonce)
+        return instance.transact(COW_ADDRESS, nonce=nonce)
+    assert manager.send(send) == '0xdeadbeef'
+    assert sent == [5, 9]
+    assert manager.next() == 10
+
+def test_transact_with_local_nonces(mocker):
+    instance = api.Api(config)
+    instance.fixed_price = True
+    instance.local_nonces = True
+    address = '0x6489ecbe173ac43dadb9f4f098c3e663e8438dd7'
+    mocker.patch('requests.Session.post', return_value=mock_json_response(result=hex(3)))
+    mock_rpc_post = mocker.patch.object(instance, '_rpc_post', side_effect=instance._rpc_post)
+    nonces.NonceManager._shared.clear()
+
+    instance.transact(address)
+    mock_rpc_post.assert_called_with('eth_sendTransaction', [{'gas': hex(100000),
+                                                              'from': COW_ADDRESS,
+                                                              'to': address,
+                                                              'data': None,
+                                                              'nonce': hex(3),
+                                                              'value': hex(0),
+                                                              'gasPrice': hex(50000000000)}])
+    assert instance.nonces() is api.Api(config).nonces()
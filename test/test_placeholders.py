@@ -0,0 +1,36 @@
+from pyepm import deploy, placeholders
+
+from helpers import config
+
+def definitions():
+    return [
+        {'set': {'NameReg': '0x72ba7d8e73fe8eb666ea66babc8116a41bfb10e2'}},
+        {'deploy': {'NameCoin': {'contract': 'namecoin.se', 'from': '$Owner'}}},
+        {'transact': {'Register': {'to': '$NameCoin', 'data': ['$NameCoin', '$NameReg', 42]}}},
+        {'call': {'Get': {'to': '$NameReg', 'data': '$NameCoin'}}},
+    ]
+
+def test_replace():
+    defs = definitions()
+    index = placeholders.Placeholders(defs)
+    assert index.replace('NameCoin', '0x01') == 3
+    assert defs[2]['transact']['Register'] == {'to': '0x01', 'data': ['0x01', '$NameReg', 42]}
+    assert defs[3]['call']['Get']['data'] == '0x01'
+    assert index.replace('NameCoin', '0x02') == 0
+    assert index.replace('Missing', '0x02') == 0
+
+def test_replace_chained():
+    defs = definitions()
+    index = placeholders.Placeholders(defs)
+    assert index.replace('Owner', '$NameReg') == 1
+    assert index.replace('NameReg', '0x03') == 3
+    assert defs[1]['deploy']['NameCoin']['from'] == '0x03'
+
+def test_deploy_replace(mocker):
+    deployment = deploy.Deploy('test/fixtures/example.yaml', config)
+    defs = definitions()
+    info = mocker.patch('pyepm.deploy.logger.info')
+    assert deployment.replace('NameReg', defs, '0x03') is defs
+    assert info.call_count == 1
+    assert info.call_args[0][0].endswith(" (2)")
+    assert defs[2]['transact']['Register']['data'][1] == '0x03'
@@ -0,0 +1,67 @@
+import pickle
+import pytest
+
+from pyepm import deploy, plan
+from pyepm.placeholders import Placeholders
+
+from helpers import COW_ADDRESS, config
+
+def compiled():
+    deployment = deploy.Deploy('test/fixtures/example.yaml', config)
+    return deployment.steps(deployment.load_yaml())
+
+def test_compile_plan():
+    steps = compiled()
+    assert [type(step) for step in steps[:6]] == [
+        plan.SetStep, plan.DeployStep, plan.DeployStep, plan.TransactStep, plan.TransactStep, plan.CallStep]
+
+    namecoin = steps[1]
+    assert (namecoin.name, namecoin.contract, namecoin.from_, namecoin.retry, namecoin.wait) == (
+        'NameCoin', 'namecoin.se', COW_ADDRESS, 15, True)
+    assert namecoin.gas == config.getint('deploy', 'gas')
+
+    register = steps[3]
+    assert register.data == ['$Subcurrency', u'0x53756263757272656e63794e616d65']
+    assert register.conversions == [['SubcurrencyName', '0x53756263757272656e63794e616d65']]
+    assert register.variables() == ['NameCoin', 'Subcurrency']
+    assert steps[4].data == ['$Subcurrency', 42, '0x0100']
+    assert steps[7].contract_names == ['multiowned', 'daylimit', 'multisig', 'Wallet']
+
+def test_compile_plan_validates():
+    with pytest.raises(Exception) as excinfo:
+        plan.compile_plan([{'deploy': {'NameCoin': {'gas': 10}}}], COW_ADDRESS, 10000, 1)
+    assert str(excinfo.value) == "No contract to deploy for NameCoin"
+    with pytest.raises(DeprecationWarning):
+        plan.compile_plan([{'transact': {'Get': {'fun_name': 'get'}}}], COW_ADDRESS, 10000, 1)
+
+def test_plan_is_picklable():
+    steps = compiled()
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        assert pickle.loads(pickle.dumps(steps, protocol)) == steps
+
+def test_plan_is_reusable():
+    steps = compiled()
+    running = [step.copy() for step in steps]
+    running[3]['data'][0] = '0x01'
+    running[3]['to'] = '0x02'
+    assert steps[3].data[0] == '$Subcurrency'
+    assert steps[3].to == '$NameCoin'
+    assert running[4] == steps[4]
+
+def test_integer_options_substituted():
+    steps = plan.compile_plan([{'set': {'amount': 1000}},
+                               {'transact': {'Pay': {'to': '$Bank', 'value': '$amount', 'gas': '$gas'}}}],
+                              COW_ADDRESS, 10000, 1)
+    pay = steps[1]
+    assert pay.variables() == ['Bank', 'gas', 'amount']
+    placeholders = Placeholders(steps)
+    placeholders.replace('amount', 1000)
+    placeholders.replace('gas', '50000')
+    pay.resolve()
+    assert (pay.value, pay.gas) == (1000, 50000)
+
+def test_unset_integer_option():
+    steps = plan.compile_plan([{'deploy': {'Bank': {'contract': 'bank.se', 'value': '$amount'}}}], COW_ADDRESS, 10000, 1)
+    with pytest.raises(Exception) as excinfo:
+        steps[0].resolve()
+    assert str(excinfo.value) == "$amount of Bank was never set"
@@ -0,0 +1,73 @@
+import pytest
+import rlp
+from ethereum import keys, transactions, utils
+
+from pyepm import api, config as c, nonces, signer
+
+from helpers import mock_batch_post, mock_json_response
+
+KEY = utils.sha3('pyepm')
+ADDRESS = '0x' + keys.privtoaddr(KEY).encode('hex')
+
+def params(nonce, data='0x'):
+    return {'from': ADDRESS, 'to': '0x6489ecbe173ac43dadb9f4f098c3e663e8438dd7', 'data': data,
+            'gas': hex(100000), 'gasPrice': hex(50000000000), 'value': hex(0), 'nonce': hex(nonce)}
+
+@pytest.fixture
+def keystore(tmpdir, mocker):
+    mocker.patch.dict(keys.PBKDF2_CONSTANTS, {'c': 2})
+    keystore = signer.Keystore(str(tmpdir.join('keystore')), 'secret')
+    assert keystore.add(KEY, 'secret') == ADDRESS
+    return keystore
+
+def test_keystore(keystore):
+    assert keystore.key(ADDRESS.upper().replace('0X', '0x')) == KEY
+    with pytest.raises(Exception) as excinfo:
+        keystore.key('0x6489ecbe173ac43dadb9f4f098c3e663e8438dd7')
+    assert "No key" in str(excinfo.value)
+
+def test_keystore_wrong_password(keystore):
+    keystore = signer.Keystore(keystore.path, 'wrong')
+    with pytest.raises(Exception) as excinfo:
+        keystore.key(ADDRESS)
+    assert "Wrong password" in str(excinfo.value)
+
+def test_sign_transaction():
+    raw = signer.sign_transaction(KEY, params(3, '0xdeadbeef'))
+    tx = rlp.decode(raw[2:].decode('hex'), transactions.Transaction)
+    assert '0x' + tx.sender.encode('hex') == ADDRESS
+    assert (tx.nonce, tx.gasprice, tx.startgas, tx.value) == (3, 50000000000, 100000, 0)
+    assert tx.to.encode('hex') == '6489ecbe173ac43dadb9f4f098c3e663e8438dd7'
+    assert tx.data == '\xde\xad\xbe\xef'
+
+def test_sign_all(keystore):
+    local = signer.LocalSigner(keystore, workers=2)
+    transactions = [params(nonce) for nonce in range(5)]
+    assert local.sign_all(transactions) == [signer.sign_transaction(KEY, p) for p in transactions]
+
+def test_send_raw_transaction(keystore, mocker):
+    settings = c.get_default_config()
+    settings.set('api', 'address', ADDRESS)
+    settings.set('deploy', 'fixed_price', 'True')
+    instance = api.Api(settings)
+    instance.signer = signer.LocalSigner(keystore, workers=1)
+    nonces.NonceManager._shared.clear()
+    post = mocker.patch('requests.Session.post', return_value=mock_json_response(result=hex(4)))
+    mock_rpc_post = mocker.patch.object(instance, '_rpc_post', side_effect=instance._rpc_post)
+
+    instance.transact('0x6489ecbe173ac43dadb9f4f098c3e663e8438dd7', data='0x')
+    mock_rpc_post.assert_called_with('eth_sendRawTransaction', [signer.sign_transaction(KEY, params(4))])
+    assert post.call_count == 2
+
+def test_batch_send_transactions(keystore, mocker):
+    instance = api.Api(c.get_default_config())
+    instance.signer = signer.LocalSigner(keystore, workers=2)
+    mocker.patch('requests.Session.post', side_effect=mock_batch_post(['0x01', '0x02', '0x03']))
+    mock_rpc_batch = mocker.patch.object(instance, '_rpc_batch', side_effect=instance._rpc_batch)
+    transactions = [params(nonce) for nonce in range(3)]
+
+    batch = instance.batch()
+    batch.send_transactions(transactions)
+    assert batch.execute() == ['0x01', '0x02', '0x03']
+    mock_rpc_batch.assert_called_once_with([('eth_sendRawTransaction', [signer.sign_transaction(KEY, p)])
+                                            for p in transactions])
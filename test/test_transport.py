@@ -0,0 +1,115 @@
+import requests
+
+from pyepm import api, config as c, transport
+
+from helpers import config, mock_json_response
+
+def test_shared_transport():
+    url = "http://127.0.0.1:8545"
+    assert transport.HttpTransport.shared(url, config) is transport.HttpTransport.shared(url, config)
+    assert api.Api(config).transport is api.Api(config).transport
+
+def test_transport_settings():
+    instance = transport.HttpTransport.from_config("http://127.0.0.1:8545", config)
+    assert instance.timeout == (5.0, 60.0)
+    assert instance.session.headers['content-type'] == 'application/json'
+    assert instance.session.headers['connection'] == 'keep-alive'
+
+    instance = transport.HttpTransport("http://127.0.0.1:8545", keep_alive=False)
+    assert instance.timeout == (None, None)
+    assert instance.session.headers['connection'] == 'close'
+
+def test_transport_post(mocker):
+    instance = transport.HttpTransport("http://127.0.0.1:8545", connect_timeout=1, read_timeout=2)
+    post = mocker.patch('requests.Session.post', return_value=mock_json_response(result='0x01'))
+    instance.post('{}')
+    instance.post('{}')
+    post.assert_called_with("http://127.0.0.1:8545", data='{}', timeout=(1, 2))
+    assert instance.stats() == {'requests': 2, 'connections': 0, 'reused': 0}
+
+class FakeTransport(object):
+    def __init__(self, url, head, fail=False):
+        self.url = url
+        self.head = head
+        self.fail = fail
+        self.posts = []
+
+    def post(self, data):
+        if self.fail:
+            raise requests.ConnectionError("Connection refused")
+        if 'eth_blockNumber' in data:
+            return mock_json_response(result=hex(self.head))
+        self.posts.append(data)
+        return mock_json_response(result='0x01')
+
+def test_is_read():
+    assert transport.is_read({'method': 'eth_call', 'params': [{}, 'latest']})
+    assert transport.is_read([{'method': 'eth_getCode', 'params': []}, {'method': 'eth_getBalance', 'params': []}])
+    assert not transport.is_read({'method': 'eth_call', 'params': [{}, 'pending']})
+    assert not transport.is_read([{'method': 'eth_getCode', 'params': []}, {'method': 'eth_sendTransaction', 'params': []}])
+    assert not transport.is_read([])
+
+def test_endpoint_pool_routing():
+    slow, fast, behind = FakeTransport('http://a', 100), FakeTransport('http://b', 99), FakeTransport('http://c', 90)
+    pool = transport.EndpointPool([slow, fast, behind], max_lag=2)
+    for endpoint, latency in zip(pool.endpoints, [0.5, 0.01, 0.001]):
+        endpoint.latency = latency
+
+    pool.post('{}')
+    # The lowest latency node is more than max_lag blocks behind
+    assert (slow.posts, fast.posts, behind.posts) == ([], ['{}'], [])
+    assert pool.stats()['endpoints']['http://c']['head'] == 90
+
+def test_endpoint_pool_signer_head():
+    signer, close, behind = FakeTransport('http://s', 100), FakeTransport('http://b', 99), FakeTransport('http://c', 90)
+    pool = transport.EndpointPool([close, behind], signer, max_lag=2)
+    pool.endpoints[0].latency, pool.endpoints[1].latency = 0.5, 0.01
+
+    pool.post('{}')
+    # Every pool node lags behind the signer, only one within max_lag
+    assert (signer.posts, close.posts, behind.posts) == ([], ['{}'], [])
+    assert [endpoint.url for endpoint in pool.ranked()] == ['http://b']
+
+    signer.fail = True
+    pool.probed = 0
+    pool.post('{}')
+    assert pool.stats()['failovers'] == 0
+
+def test_endpoint_pool_background_probes(mocker):
+    slow = FakeTransport('http://a', 100)
+    pool = transport.EndpointPool([slow], head_interval=0)
+    wait = mocker.patch('concurrent.futures.wait')
+    pool.post('{}')
+    pool.post('{}')
+    assert wait.call_count == 1  # only the first request waits for heads
+
+def test_endpoint_pool_failover():
+    slow, fast = FakeTransport('http://a', 100), FakeTransport('http://b', 100)
+    pool = transport.EndpointPool([slow, fast], head_interval=60)
+    pool.endpoints[0].latency, pool.endpoints[1].latency = 0.5, 0.01
+    fast.fail = True
+
+    pool.post('{}')
+    pool.post('{}')
+    assert slow.posts == ['{}', '{}']
+    assert [endpoint.url for endpoint in pool.ranked()] == ['http://a']
+    assert pool.stats()['failovers'] == 1
+
+    slow.fail = True
+    assert pool.post('{}') is None
+
+def test_api_read_write_split(mocker):
+    settings = c.get_default_config()
+    settings.set('api', 'endpoints', 'http://10.0.0.1:8545, http://10.0.0.2:8545')
+    urls = []
+
+    def post(url, data=None, **kwargs):
+        if 'eth_blockNumber' not in data:
+            urls.append(url)
+        return mock_json_response(result='0x01')
+    mocker.patch('requests.Session.post', side_effect=post)
+    instance = api.Api(settings)
+    instance.is_contract_at('0x6489ecbe173ac43dadb9f4f098c3e663e8438dd7')
+    instance.transaction_count(defaultBlock='pending')
+    assert urls[0] in ['http://10.0.0.1:8545', 'http://10.0.0.2:8545']
+    assert urls[1] == 'http://127.0.0.1:8545'